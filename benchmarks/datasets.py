@@ -0,0 +1,131 @@
+"""
+Generation of synthetic datasets and queries for the benchmarks.
+
+Data is generated with a fixed random seed, so that runs on
+different commits process the same input.
+"""
+
+from __future__ import absolute_import
+
+import csv
+import json
+import os
+import random
+
+
+def _random(seed=42):
+    return random.Random(seed)
+
+
+def narrow_rows(count):
+    rnd = _random()
+    for index in xrange(count):
+        yield (index, 'item-{0}'.format(index),
+               round(rnd.uniform(0, 1000), 2), rnd.randint(1, 100))
+
+
+def write_narrow_csv(path, count):
+    """``id,name,price,qty`` CSV file, with header"""
+
+    with open(path, 'wb') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(('id', 'name', 'price', 'qty'))
+        writer.writerows(narrow_rows(count))
+
+
+def write_wide_csv(path, count, columns=200):
+    """``c0,c1,...`` CSV file with ``columns`` numeric columns"""
+
+    rnd = _random()
+    with open(path, 'wb') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['c{0}'.format(x) for x in xrange(columns)])
+        for _ in xrange(count):
+            writer.writerow([rnd.randint(0, 10000) for _ in xrange(columns)])
+
+
+def nested_records(count):
+    rnd = _random()
+    for index in xrange(count):
+        yield {
+            'id': index,
+            'user': {
+                'name': 'user-{0}'.format(rnd.randint(0, 1000)),
+                'tags': ['tag-{0}'.format(rnd.randint(0, 20))
+                         for _ in xrange(rnd.randint(0, 5))],
+            },
+            'values': [rnd.random() for _ in xrange(10)],
+            'price': round(rnd.uniform(0, 1000), 2),
+        }
+
+
+def write_nested_json(path, count, lines=False):
+    """Nested records, as a JSON array or a JSON Lines file"""
+
+    with open(path, 'wb') as fp:
+        if lines:
+            for record in nested_records(count):
+                fp.write(json.dumps(record) + '\n')
+        else:
+            json.dump(list(nested_records(count)), fp)
+
+
+def linear_query(devices):
+    """A long pipeline of per-item devices"""
+
+    parts = []
+    for index in xrange(devices):
+        parts.append([
+            "Filter(item['price'] > {0})".format(index % 10),
+            "Transform(copy='shallow', f{0}=item['price'] * 2)".format(index),
+            "Map(item)",
+        ][index % 3])
+    return ' | '.join(parts)
+
+
+def block_query(depth, width=2):
+    """Nested blocks of pipelines"""
+
+    if depth == 0:
+        return "Filter(item['price'] > 10) | Map(item['id'])"
+    inner = ', '.join(block_query(depth - 1, width) for _ in xrange(width))
+    return "Map(item) | {{ {0} }}".format(inner)
+
+
+class Datasets(object):
+    """
+    Generated files, in ``directory``; each one is only generated
+    the first time it is asked for.
+    """
+
+    def __init__(self, directory, scale=1.0):
+        self.directory = directory
+        self.scale = scale
+
+    def count(self, base):
+        return max(1, int(base * self.scale))
+
+    def path(self, name, generate, count, **kwargs):
+        # Include the size in the name, for runs at different scales
+        base, ext = os.path.splitext(name)
+        path = os.path.join(self.directory,
+                            '{0}-{1}{2}'.format(base, count, ext))
+        if not os.path.exists(path):
+            generate(path + '.tmp', count, **kwargs)
+            os.rename(path + '.tmp', path)
+        return path
+
+    def narrow_csv(self):
+        return self.path('narrow.csv', write_narrow_csv,
+                         self.count(200000))
+
+    def wide_csv(self):
+        return self.path('wide.csv', write_wide_csv, self.count(20000))
+
+    def nested_json(self):
+        return self.path('nested.json', write_nested_json,
+                         self.count(50000))
+
+    def nested_jsonl(self):
+        return self.path('nested.jsonl', write_nested_json,
+                         self.count(50000), lines=True)
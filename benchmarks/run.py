@@ -0,0 +1,154 @@
+"""
+Run the benchmarks, and save results as JSON::
+
+    python -m benchmarks.run -o results.json
+    python -m benchmarks.run -k io. --compare results.json
+
+Each benchmark runs in its own forked process, so that its peak
+memory usage can be measured. Results hold, for each benchmark,
+the best and mean time over ``--repeat`` runs, the throughput
+(items per second) and the growth of peak RSS during the benchmark.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+from .datasets import Datasets
+from .suite import BENCHMARKS
+
+
+def _maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(case, data, repeat):
+    baseline = _maxrss()
+    run, items = case(data)
+    run()  # Warm up (caches, lazy imports, ...)
+
+    times = []
+    for _ in xrange(repeat):
+        start = time.time()
+        run()
+        times.append(time.time() - start)
+
+    best = min(times)
+    return {
+        'seconds': best,
+        'mean_seconds': sum(times) / len(times),
+        'items': items,
+        'items_per_second': items / best if best else None,
+        'peak_rss_kb': _maxrss() - baseline,
+    }
+
+
+def measure_forked(case, data, repeat):
+    """Run :py:func:`measure` in a child process"""
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if not pid:
+        os.close(read_fd)
+        try:
+            result = measure(case, data, repeat)
+        except Exception:
+            result = {'error': traceback.format_exc()}
+        with os.fdopen(write_fd, 'w') as fp:
+            json.dump(result, fp)
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as fp:
+        output = fp.read()
+    os.waitpid(pid, 0)
+    if not output:
+        return {'error': 'benchmark process died'}
+    return json.loads(output)
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format(name, result, baseline=None):
+    if 'error' in result:
+        return '{0:<32} ERROR'.format(name)
+    line = '{0:<32} {1:>10.4f}s {2:>14,.0f} items/s {3:>9,d}KB'.format(
+        name, result['seconds'], result['items_per_second'] or 0,
+        result['peak_rss_kb'])
+    if baseline is not None and 'seconds' in baseline:
+        line += '  x{0:.2f}'.format(result['seconds'] / baseline['seconds'])
+    return line
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='benchmarks.run',
+                                     description='Run the benchmarks.')
+    parser.add_argument('-o', '--output', help='write results to this file')
+    parser.add_argument('-k', dest='keyword', default='',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='dataset size multiplier')
+    parser.add_argument('--data-dir', default=None,
+                        help='where to keep generated datasets')
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help='print time ratios against these results')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(),
+                                             'dq-benchmarks')
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    data = Datasets(data_dir, scale=args.scale)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)['results']
+
+    results = {}
+    for name, case in BENCHMARKS.iteritems():
+        if args.keyword not in name:
+            continue
+        results[name] = measure_forked(case, data, args.repeat)
+        print(_format(name, results[name], baseline.get(name)))
+
+    report = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'scale': args.scale,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+
+    if any('error' in x for x in results.itervalues()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""
+Benchmark cases.
+
+Each case is a function accepting a :py:class:`datasets.Datasets`
+object, doing its setup and returning a ``(run, items)`` tuple:
+``run()`` is the function to be timed, ``items`` the number of items
+(rows, tokens, ...) it processes, used to compute throughput.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import itertools
+import os
+
+from dq.ast import Expression
+from dq.execution import execute
+from dq.lexer import lexer
+from dq.parser import parser
+from dq.piping import filter as devices
+from dq.piping.fused import Fused
+from dq.piping.io_csv import InCSV, OutCSV
+from dq.piping.io_json import (
+    InJSON, InJSONArray, InJSONLines, OutJSON, OutJSONLines)
+from dq.piping.tee import BoundedTee, LockstepScheduler, dispatch_stream
+
+from . import datasets
+
+
+# name -> function, in definition order
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(name):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def consume(result):
+    """Exhaust streams in a result (a stream, or a block's tuple)"""
+
+    if isinstance(result, tuple):
+        for item in result:
+            consume(item)
+    elif isinstance(result, collections.Iterator):
+        for _ in result:
+            pass
+
+
+def _expr(text):
+    return Expression.from_string(text)
+
+
+def _records(data, base=50000):
+    return list(datasets.nested_records(data.count(base)))
+
+
+# ------------------------------------------------------------
+# Lexer and parser
+# ------------------------------------------------------------
+
+@benchmark('lexer.linear_query')
+def lexer_linear(data):
+    text = datasets.linear_query(data.count(5000))
+    lexer.input(text)
+    tokens = len(list(lexer))
+
+    def run():
+        lexer.input(text)
+        for _ in lexer:
+            pass
+    return run, tokens
+
+
+@benchmark('parser.linear_query')
+def parser_linear(data):
+    count = data.count(5000)
+    text = datasets.linear_query(count)
+    return lambda: parser.parse(text), count
+
+
+@benchmark('parser.nested_blocks')
+def parser_blocks(data):
+    text = datasets.block_query(8)
+    return lambda: parser.parse(text), 2 ** 8
+
+
+# ------------------------------------------------------------
+# Execution
+# ------------------------------------------------------------
+
+def _execute_case(query, data, **options):
+    pipe = parser.parse(query)
+    records = _records(data)
+
+    def run():
+        consume(execute(pipe, (iter(records),), **options))
+    return run, len(records)
+
+
+@benchmark('execute.linear')
+def execute_linear(data):
+    return _execute_case(datasets.linear_query(30), data)
+
+
+@benchmark('execute.linear_unoptimized')
+def execute_linear_unoptimized(data):
+    return _execute_case(datasets.linear_query(30), data,
+                         optimize=False, fuse=False)
+
+
+@benchmark('execute.linear_batches')
+def execute_linear_batches(data):
+    return _execute_case(datasets.linear_query(30), data, batch_size=1024)
+
+
+def _blocks_case(mode):
+    def case(data):
+        return _execute_case(datasets.block_query(3), data, block_mode=mode)
+    return case
+
+
+for _mode in ('lockstep', 'tee', 'threads'):
+    benchmark('execute.blocks_' + _mode)(_blocks_case(_mode))
+
+
+def _csv_case(query, **options):
+    def case(data):
+        pipe = parser.parse(query.format(data.narrow_csv()))
+
+        def run():
+            consume(execute(pipe, **options))
+        return run, data.count(200000)
+    return case
+
+
+# Row-wise vs. columnar (NumPy) filtering, keeping 20% / 1% of the rows
+_CSV_FILTERS = {
+    'csv_filter': "Filter(float(item.price) >= 800)",
+    'csv_filter_selective': "Filter(float(item.price) >= 990)",
+}
+
+for _name, _filter in sorted(_CSV_FILTERS.items()):
+    _query = "InCSV({0!r}, header=True) | " + _filter
+    benchmark('execute.{0}_rowwise'.format(_name))(_csv_case(_query))
+    benchmark('execute.{0}_columnar'.format(_name))(
+        _csv_case(_query, columnar=True))
+
+
+# ------------------------------------------------------------
+# Devices in dq.piping.filter
+# ------------------------------------------------------------
+
+def _device_case(make_device, items=None):
+    def case(data):
+        records = _records(data) if items is None else items(data)
+        device = make_device()
+
+        def run():
+            consume(device(iter(records)))
+        return run, len(records)
+    return case
+
+
+benchmark('devices.Filter')(_device_case(
+    lambda: devices.Filter(_expr("item['price'] > 500"))))
+benchmark('devices.Map')(_device_case(
+    lambda: devices.Map(_expr("item['price'] * 2"))))
+for _copy in ('deep', 'shallow', 'overlay', 'none'):
+    benchmark('devices.Transform_' + _copy)(_device_case(
+        lambda _copy=_copy: devices.Transform(
+            copy=_expr(repr(_copy)), total=_expr("item['price'] * 2"))))
+benchmark('devices.List')(_device_case(lambda: devices.List()))
+benchmark('devices.Dict')(_device_case(
+    lambda: devices.Dict(),
+    items=lambda data: [(x, x) for x in xrange(data.count(200000))]))
+
+
+@benchmark('devices.Fused')
+def devices_fused(data):
+    pipe = parser.parse(datasets.linear_query(30))
+    return _device_case(lambda: Fused(*pipe))(data)
+
+
+# ------------------------------------------------------------
+# Tees
+# ------------------------------------------------------------
+
+def _tee_case(run_tee, consumers=4):
+    def case(data):
+        count = data.count(200000)
+
+        def run():
+            run_tee(xrange(count), consumers)
+        return run, count * consumers
+    return case
+
+
+def _consumer(stream):
+    for _ in stream:
+        pass
+
+
+def _itertools_tee(stream, consumers):
+    for copy in itertools.tee(stream, consumers):
+        _consumer(copy)
+
+
+def _dispatch_stream(stream, consumers):
+    dispatch_stream(stream, *([_consumer] * consumers))
+
+
+def _bounded_tee(stream, consumers):
+    scheduler = LockstepScheduler()
+    tee = BoundedTee(stream, consumers, 1024, scheduler)
+    scheduler.run([lambda copy=copy: _consumer(copy)
+                   for copy in tee.consumers()])
+
+
+benchmark('tee.itertools_tee')(_tee_case(_itertools_tee))
+benchmark('tee.dispatch_stream')(_tee_case(_dispatch_stream))
+benchmark('tee.bounded_tee')(_tee_case(_bounded_tee))
+
+
+# ------------------------------------------------------------
+# I/O devices
+# ------------------------------------------------------------
+
+def _input_case(make_device, path, rows):
+    def case(data):
+        filename = path(data)
+        count = data.count(rows)
+
+        def run():
+            consume(make_device(_expr(repr(filename)))())
+        return run, count
+    return case
+
+
+benchmark('io.InCSV_narrow')(_input_case(
+    lambda f: InCSV(f, header=_expr('True')),
+    datasets.Datasets.narrow_csv, 200000))
+benchmark('io.InCSV_narrow_typed')(_input_case(
+    lambda f: InCSV(f, header=_expr('True'), types=_expr("'infer'")),
+    datasets.Datasets.narrow_csv, 200000))
+benchmark('io.InCSV_wide')(_input_case(
+    lambda f: InCSV(f, header=_expr('True')),
+    datasets.Datasets.wide_csv, 20000))
+benchmark('io.InCSV_wide_projected')(_input_case(
+    lambda f: InCSV(f, header=_expr('True'), columns=_expr("['c1', 'c5']")),
+    datasets.Datasets.wide_csv, 20000))
+benchmark('io.InJSON')(_input_case(
+    InJSON, datasets.Datasets.nested_json, 50000))
+benchmark('io.InJSONArray')(_input_case(
+    InJSONArray, datasets.Datasets.nested_json, 50000))
+benchmark('io.InJSONLines')(_input_case(
+    InJSONLines, datasets.Datasets.nested_jsonl, 50000))
+
+
+def _output_case(make_device, items, suffix):
+    def case(data):
+        records = items(data)
+        path = os.path.join(data.directory, 'output' + suffix)
+
+        def run():
+            # Output devices close their file when done
+            make_device(_expr(repr(path)))(iter(records))
+        return run, len(records)
+    return case
+
+
+benchmark('io.OutCSV')(_output_case(
+    OutCSV, lambda data: list(datasets.narrow_rows(data.count(200000))),
+    '.csv'))
+benchmark('io.OutJSON')(_output_case(OutJSON, _records, '.json'))
+benchmark('io.OutJSONLines')(_output_case(OutJSONLines, _records, '.jsonl'))
@@ -0,0 +1,6 @@
+from __future__ import absolute_import
+
+from dq.cli import main
+
+
+main()
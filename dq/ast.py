@@ -2,7 +2,101 @@ from __future__ import absolute_import
 
 import ast
 import collections
+import copy
+import marshal
 import sys
+import types
+
+
+# Globals available to all the expressions.
+# Resolved once, instead of on each evaluation.
+EXPRESSION_GLOBALS = {
+    'stdin': sys.stdin,
+    'stdout': sys.stdout,
+    'stderr': sys.stderr,
+}
+
+# Operands / results of folded constants larger than this
+# will be left alone, to avoid blowing up on things like ``'x' * 10**9``
+_FOLD_MAX_SIZE = 4096
+
+
+def _is_constant(node):
+    return isinstance(node, (ast.Num, ast.Str))
+
+
+def _constant_node(value):
+    if isinstance(value, basestring):
+        if len(value) > _FOLD_MAX_SIZE:
+            return None
+        return ast.Str(s=value)
+    if isinstance(value, (int, long, float, complex)) \
+            and not isinstance(value, bool):
+        if isinstance(value, (int, long)) \
+                and value.bit_length() > _FOLD_MAX_SIZE:
+            return None
+        return ast.Num(n=value)
+    return None
+
+
+class ConstantFolder(ast.NodeTransformer):
+    """
+    Replace operations between literal numbers / strings
+    with their result, eg. ``item.price > 60 * 60`` becomes
+    ``item.price > 3600``.
+    """
+
+    def _fold(self, node):
+        expr = ast.fix_missing_locations(ast.Expression(node))
+        try:
+            value = eval(compile(expr, '<fold>', 'eval'), {})
+        except Exception:
+            # Let the error happen at runtime, if ever
+            return node
+        folded = _constant_node(value)
+        if folded is None:
+            return node
+        return ast.copy_location(folded, node)
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if not (_is_constant(node.left) and _is_constant(node.right)):
+            return node
+        if isinstance(node.op, ast.Pow) and isinstance(node.right, ast.Num) \
+                and abs(node.right.n) > 64:
+            return node
+        return self._fold(node)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not) or not _is_constant(node.operand):
+            return node
+        return self._fold(node)
+
+
+def fold_constants(node):
+    """Return a copy of ``node``, with constant operations folded"""
+
+    return ConstantFolder().visit(copy.deepcopy(node))
+
+
+def iter_expressions(obj):
+    """
+    Iterate all the :py:class:`Expression` objects in a
+    pipeline / block / device.
+    """
+
+    if isinstance(obj, Expression):
+        yield obj
+    elif isinstance(obj, Device):
+        # Devices such as ``Fused`` get other devices as arguments
+        for arg in obj.args + tuple(obj.keywords.itervalues()):
+            for expr in iter_expressions(arg):
+                yield expr
+    else:
+        for item in obj:
+            for expr in iter_expressions(item):
+                yield expr
 
 
 class WrappedList(collections.MutableSequence):
@@ -90,6 +184,32 @@ class Expression(object):
         node = ast.parse(s).body[0].value
         return cls(node, name=name)
 
+    def __getstate__(self):
+        # Code objects and functions cannot be pickled:
+        # we store marshalled code objects instead.
+        state = self.__dict__.copy()
+        compiled = state.pop('_compiled', None)
+        functions = state.pop('_functions', {})
+        if compiled is not None:
+            state['_compiled_code'] = marshal.dumps(compiled)
+        if functions:
+            state['_functions_code'] = dict(
+                (argnames, marshal.dumps(func.__code__))
+                for argnames, func in functions.iteritems())
+        return state
+
+    def __setstate__(self, state):
+        compiled = state.pop('_compiled_code', None)
+        functions = state.pop('_functions_code', {})
+        self.__dict__.update(state)
+        if compiled is not None:
+            self._compiled = marshal.loads(compiled)
+        if functions:
+            self._functions = dict(
+                (argnames, types.FunctionType(
+                    marshal.loads(code), EXPRESSION_GLOBALS))
+                for argnames, code in functions.iteritems())
+
     def __repr__(self):
         return "{0}({1!r}, name={2!r})".format(
             self.__class__.__name__, self.node, self.name)
@@ -97,7 +217,9 @@ class Expression(object):
     def compile(self):
         """Compile the node using compile() builtin"""
 
-        return compile(ast.Expression(self.node), self.name, 'eval')
+        expr = ast.fix_missing_locations(
+            ast.Expression(fold_constants(self.node)))
+        return compile(expr, self.name, 'eval')
 
     @property
     def compiled(self):
@@ -106,18 +228,39 @@ class Expression(object):
             comp = self._compiled = self.compile()
         return comp
 
+    def function(self, *argnames):
+        """
+        Get a function evaluating this expression, accepting
+        ``argnames`` as positional arguments.
+
+        Eg. ``expr.function('item')`` returns the equivalent of
+        ``lambda item: <expression>``, to be called directly
+        once per item, instead of using :py:meth:`evaluate`.
+        """
+
+        functions = self.__dict__.setdefault('_functions', {})
+        func = functions.get(argnames)
+        if func is None:
+            func = functions[argnames] = self._make_function(argnames)
+        return func
+
+    def _make_function(self, argnames):
+        args = ast.arguments(
+            args=[ast.Name(id=name, ctx=ast.Param()) for name in argnames],
+            vararg=None, kwarg=None, defaults=[])
+        expr = ast.Expression(
+            ast.Lambda(args=args, body=fold_constants(self.node)))
+        ast.fix_missing_locations(expr)
+        return eval(compile(expr, self.name, 'eval'), EXPRESSION_GLOBALS)
+
     def evaluate(self, loc=None, glob=None):
         """Evaluate this expression in a given scope"""
 
-        globs = {
-            'stdin': sys.stdin,
-            'stdout': sys.stdout,
-            'stderr': sys.stderr,
-        }
-
+        globs = EXPRESSION_GLOBALS
         if glob is not None:
+            globs = dict(globs)
             globs.update(glob)
 
         if loc is None:
             loc = {}
-        return eval(self.compiled, glob, loc)
+        return eval(self.compiled, globs, loc)
@@ -0,0 +1,275 @@
+"""
+Strategies for running the pipelines of a block.
+
+In ``'tee'`` mode, pipelines are run one after the other, each one
+receiving an ``itertools.tee`` copy of the input streams. It is
+faster than ``'lockstep'`` mode, but the copies buffer as many items
+as the first pipeline gets ahead of the others, ie. usually the
+whole stream.
+
+In ``'lockstep'`` mode (the default), pipelines run concurrently as
+greenlets, over copies of the input streams buffering at most
+``max_buffer`` items: a pipeline getting too far ahead waits for the
+others to catch up. If that is not possible (eg. a pipeline returns
+a lazy stream, which will only be consumed later), an error is raised
+instead of buffering without limits.
+
+In ``'threads'`` mode, each pipeline runs in its own thread, and
+input streams are dispatched to them by a feeder thread, through
+bounded queues: memory usage is constant, and pipelines waiting
+on I/O do not block each other.
+
+The same queues are used to run the devices of a pipeline as
+concurrent stages (see :py:func:`run_stage`).
+"""
+
+from __future__ import absolute_import
+
+import itertools
+import Queue
+import sys
+import threading
+import types
+
+import six
+
+from .piping.base import BatchStream, batched
+from .piping.tee import BoundedTee, LockstepScheduler
+
+
+BLOCK_MODES = ('lockstep', 'tee', 'threads')
+
+DEFAULT_QUEUE_SIZE = 1024
+
+# Most items passed at once by a QueueTee
+MESSAGE_SIZE = 256
+
+DEFAULT_MAX_BUFFER = 65536
+
+_ITEMS, _END, _ERROR = 'items', 'end', 'error'
+
+
+def split_args(args, count, tee, tee_batches=None):
+    """
+    Get a list of ``count`` argument tuples, one for each pipeline
+    in a block, using ``tee(iterable, count)`` to copy streams
+    (``tee_batches``, if passed, for the batches of a ``BatchStream``).
+    """
+
+    args_matrix = [[] for _ in xrange(count)]
+
+    for arg in args:
+        if isinstance(arg, BatchStream):
+            # Tee the batches, they will not be modified
+            copies = [BatchStream(x)
+                      for x in (tee_batches or tee)(arg.batches, count)]
+
+        elif isinstance(arg, types.GeneratorType):
+            # We need a generator for each pipeline
+            copies = tee(arg, count)
+
+        else:
+            # We just need to pass multiple copies
+            copies = (arg,) * count
+
+        for pipe_args, arg_copy in zip(args_matrix, copies):
+            pipe_args.append(arg_copy)
+
+    return [tuple(x) for x in args_matrix]
+
+
+def run_block_tee(pipes, args, run):
+    """Run pipelines sequentially, over ``itertools.tee`` copies"""
+
+    args_matrix = split_args(args, len(pipes), itertools.tee)
+    return tuple(run(pipe, pipe_args)
+                 for pipe, pipe_args in zip(pipes, args_matrix))
+
+
+def _is_lazy(result):
+    return isinstance(result, (BatchStream, types.GeneratorType))
+
+
+def run_block_lockstep(pipes, args, run, max_buffer=DEFAULT_MAX_BUFFER):
+    """
+    Run pipelines concurrently, as greenlets, over copies of the
+    input streams buffering at most ``max_buffer`` items
+    (see :py:class:`dq.piping.tee.BoundedTee`).
+    """
+
+    scheduler = LockstepScheduler()
+    tees = []
+
+    def _tee(iterable, count):
+        tee = BoundedTee(iterable, count, max_buffer, scheduler)
+        tees.append(tee)
+        return tee.consumers()
+
+    args_matrix = split_args(args, len(pipes), _tee)
+
+    def _branch(index, pipe, pipe_args):
+        def branch():
+            result = run(pipe, pipe_args)
+            if not _is_lazy(result):
+                # Don't hold the buffer for pipelines that are done
+                for tee in tees:
+                    tee.close(index)
+            return result
+        return branch
+
+    return tuple(scheduler.run([
+        _branch(index, pipe, pipe_args)
+        for index, (pipe, pipe_args) in enumerate(zip(pipes, args_matrix))]))
+
+
+class QueueTee(object):
+    """
+    Dispatch items from an iterable to multiple consumers, each
+    one reading from its own bounded queue.
+
+    Items are read by a feeder thread, which blocks when a queue is
+    full, until the slowest consumer catches up. Consumers that are
+    done (closed) are skipped.
+
+    Items are passed in lists of ``message_size`` items (by default,
+    up to ``MESSAGE_SIZE``, a fourth of ``maxsize``), not to pay for
+    the queue locks on each item; queues hold at most ``maxsize``
+    items.
+    """
+
+    def __init__(self, iterable, count, maxsize=DEFAULT_QUEUE_SIZE,
+                 message_size=None):
+        if message_size is None:
+            message_size = min(MESSAGE_SIZE, max(1, maxsize // 4))
+        self.message_size = message_size
+        self.queues = [Queue.Queue(max(1, maxsize // message_size))
+                       for _ in xrange(count)]
+        self.closed = [False] * count
+        self.thread = threading.Thread(target=self._feed, args=(iterable,))
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def _broadcast(self, message):
+        # Consumers going away empty their queue (see close()),
+        # so that the feeder is not blocked on them.
+        for index, queue in enumerate(self.queues):
+            if not self.closed[index]:
+                queue.put(message)
+
+    def _feed(self, iterable):
+        try:
+            for items in batched(iterable, self.message_size):
+                self._broadcast((_ITEMS, items))
+                if all(self.closed):
+                    break
+        except Exception:
+            self._broadcast((_ERROR, sys.exc_info()))
+        else:
+            self._broadcast((_END, None))
+
+    def consumer(self, index):
+        """Get the iterator for the ``index``-th consumer"""
+
+        queue = self.queues[index]
+        try:
+            while True:
+                kind, value = queue.get()
+                if kind == _ITEMS:
+                    for item in value:
+                        yield item
+                elif kind == _END:
+                    return
+                else:
+                    six.reraise(*value)
+        finally:
+            self.close(index)
+
+    def close(self, index):
+        self.closed[index] = True
+        # Unblock the feeder, if it is waiting on this queue
+        queue = self.queues[index]
+        try:
+            while True:
+                queue.get_nowait()
+        except Queue.Empty:
+            pass
+
+
+def run_stage(result, queue_size=DEFAULT_QUEUE_SIZE, message_size=None):
+    """
+    Consume a lazy device result in a thread, passing items to
+    the next device through a queue of at most ``queue_size`` items
+    (batches, for a ``BatchStream``, passed one by one). Other
+    results are returned as they are.
+    """
+
+    if isinstance(result, BatchStream):
+        return BatchStream(run_stage(result.batches, queue_size, 1))
+    if not isinstance(result, types.GeneratorType):
+        return result
+    tee = QueueTee(result, 1, queue_size, message_size)
+    tee.start()
+    return tee.consumer(0)
+
+
+def _materialize(result):
+    # Lazy results must be consumed in the pipeline thread,
+    # or they would never read their input.
+    if isinstance(result, BatchStream):
+        return BatchStream(list(result.batches))
+    if isinstance(result, types.GeneratorType):
+        return (x for x in list(result))
+    return result
+
+
+def run_block_threads(pipes, args, run, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Run each pipeline in its own thread, dispatching streams
+    through bounded queues (see :py:class:`QueueTee`).
+
+    Pipelines returning a stream are consumed by their thread, and
+    their output kept in memory.
+    """
+
+    count = len(pipes)
+    tees = []
+
+    def _tee(iterable, count, message_size=None):
+        tee = QueueTee(iterable, count, queue_size, message_size)
+        tees.append(tee)
+        return [tee.consumer(index) for index in xrange(count)]
+
+    def _tee_batches(iterable, count):
+        return _tee(iterable, count, message_size=1)
+
+    args_matrix = split_args(args, count, _tee, _tee_batches)
+    results = [None] * count
+    errors = [None] * count
+
+    def _run(index, pipe, pipe_args):
+        try:
+            results[index] = _materialize(run(pipe, pipe_args))
+        except Exception:
+            errors[index] = sys.exc_info()
+        finally:
+            for tee in tees:
+                tee.close(index)
+
+    threads = [threading.Thread(target=_run, args=(index, pipe, pipe_args))
+               for index, (pipe, pipe_args)
+               in enumerate(zip(pipes, args_matrix))]
+
+    for thread in threads:
+        thread.start()
+    for tee in tees:
+        tee.start()
+    for thread in threads:
+        thread.join()
+
+    for error in errors:
+        if error is not None:
+            six.reraise(*error)
+
+    return tuple(results)
@@ -0,0 +1,157 @@
+"""
+On-disk cache of parsed queries.
+
+Parsed pipelines, along with the compiled code of their expressions,
+are pickled to a cache directory, keyed by query text, cache format,
+dq version, sources of the modules building the trees and Python
+version, so repeated queries can skip lexing, parsing and compilation
+entirely (similar in spirit to ``.pyc`` files).
+
+The cache directory defaults to ``$DQ_CACHE_DIR``, or ``~/.cache/dq``.
+It holds at most ``MAX_ENTRIES`` queries, the least recently used
+ones being removed first.
+"""
+
+from __future__ import absolute_import
+
+import cPickle as pickle
+import hashlib
+import os
+import sys
+import tempfile
+
+import dq
+from dq.ast import iter_expressions
+
+
+# Bump when the format of cached files changes
+CACHE_FORMAT = '1'
+
+MAX_ENTRIES = 1000
+
+# Modules defining (and building) the pickled trees
+_SOURCE_MODULES = ('ast.py', 'lexer.py', 'parser.py')
+
+_sources_digest = None
+
+
+def get_cache_dir():
+    return os.environ.get('DQ_CACHE_DIR') or os.path.join(
+        os.path.expanduser('~'), '.cache', 'dq')
+
+
+def _get_sources_digest():
+    # Changes to the sources (eg. in a development checkout) must
+    # invalidate the cache, even if the version is the same.
+    global _sources_digest
+    if _sources_digest is None:
+        digest = hashlib.sha1()
+        directory = os.path.dirname(os.path.abspath(dq.__file__))
+        for name in _SOURCE_MODULES:
+            try:
+                with open(os.path.join(directory, name), 'rb') as fp:
+                    digest.update(fp.read())
+            except IOError:
+                # Eg. installed without sources
+                digest.update(name)
+        _sources_digest = digest.hexdigest()
+    return _sources_digest
+
+
+def cache_key(text):
+    key = hashlib.sha1()
+    parts = (CACHE_FORMAT, dq.__version__, _get_sources_digest(),
+             sys.version, text)
+    for part in parts:
+        if isinstance(part, unicode):
+            part = part.encode('utf-8')
+        key.update(part)
+        key.update('\0')
+    return key.hexdigest()
+
+
+def precompile(tree):
+    """Compile all the expressions in a parsed tree"""
+
+    for expr in iter_expressions(tree):
+        expr.compiled
+        expr.function('item')
+    return tree
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as fp:
+            tree = pickle.load(fp)
+    except Exception:
+        # Missing, corrupted or incompatible: just parse again
+        return None
+    try:
+        # Recently used entries are kept by _prune()
+        os.utime(path, None)
+    except OSError:
+        pass
+    return tree
+
+
+def _save(path, tree):
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    # Write to a temporary file, then rename atomically,
+    # to play nice with concurrent processes.
+    fd, tmppath = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(tree, fp, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmppath, path)
+    except Exception:
+        os.unlink(tmppath)
+        raise
+
+
+def _prune(dirname):
+    """Remove the least recently used entries, past ``MAX_ENTRIES``"""
+
+    entries = []
+    for name in os.listdir(dirname):
+        if not name.endswith('.pickle'):
+            continue
+        path = os.path.join(dirname, name)
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            pass  # Removed by another process
+    entries.sort()
+    for _, path in entries[:len(entries) - MAX_ENTRIES]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def parse(text, cache_dir=None):
+    """
+    Parse a query, returning a pipeline with compiled expressions,
+    loaded from the cache if available.
+    """
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    path = os.path.join(cache_dir, cache_key(text) + '.pickle')
+
+    tree = _load(path)
+    if tree is not None:
+        return tree
+
+    # Only import the parser (and build its tables) when needed
+    from dq.parser import parser
+    tree = precompile(parser.parse(text))
+
+    try:
+        _save(path, tree)
+        _prune(cache_dir)
+    except (IOError, OSError):
+        pass  # The cache is just an optimization
+    return tree
@@ -0,0 +1,71 @@
+"""
+Command line interface, to run a query::
+
+    python -m dq 'InCSV(stdin, header=True) | Filter(item.id == "1")
+                  | OutCSV(stdout)'
+
+Queries are parsed through the cache (see :py:mod:`dq.cache`). If the
+query returns something (eg. a stream), its items are printed, one
+per line. The results of a block are printed in turn, streams item
+by item.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import collections
+import sys
+
+from .blocks import BLOCK_MODES
+from .cache import parse
+from .execution import execute
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='dq', description='Run a query.')
+    parser.add_argument('query', help="the query to run ('-' to read it "
+                        "from standard input)")
+    parser.add_argument('--profile', action='store_true',
+                        help='write per-device statistics to stderr')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='exchange items in batches of this size')
+    parser.add_argument('--columnar', action='store_true',
+                        help='vectorize CSV filtering, using NumPy')
+    parser.add_argument('--block-mode', choices=BLOCK_MODES,
+                        help='how to run pipelines in blocks')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='run devices as concurrent threads')
+    parser.add_argument('--no-optimize', dest='optimize',
+                        action='store_false',
+                        help="don't rewrite pipelines")
+    parser.add_argument('--no-fuse', dest='fuse', action='store_false',
+                        help="don't fuse per-item devices")
+    return parser
+
+
+def _print_result(result, fp):
+    if result is None:
+        return
+    if isinstance(result, tuple):
+        # Results of a block (possibly nested)
+        for value in result:
+            if isinstance(value, (tuple, collections.Iterator)):
+                _print_result(value, fp)
+            else:
+                print(value, file=fp)
+    elif isinstance(result, (list, collections.Iterator)):
+        for item in result:
+            print(item, file=fp)
+    else:
+        print(result, file=fp)
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    query = sys.stdin.read() if args.query == '-' else args.query
+
+    result = execute(parse(query), optimize=args.optimize, fuse=args.fuse,
+                     batch_size=args.batch_size, columnar=args.columnar,
+                     block_mode=args.block_mode, pipelined=args.pipelined,
+                     profile=args.profile)
+    _print_result(result, sys.stdout)
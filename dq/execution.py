@@ -1,26 +1,70 @@
 from __future__ import absolute_import
 
-import inspect
-import itertools
+import functools
+import importlib
 
 from .ast import Pipeline, PipelineBlock, Device
-import dq.piping.filter
-import dq.piping.io_csv
-import dq.piping.io_json
+from .blocks import (
+    run_block_lockstep, run_block_tee, run_block_threads, run_stage,
+    BLOCK_MODES, DEFAULT_MAX_BUFFER, DEFAULT_QUEUE_SIZE)
+from .piping.base import BatchStream, batched
+
+
+class DeviceRegister(dict):
+    """
+    Maps device names to device classes.
+
+    Values can also be ``'module:ClassName'`` strings: the module is
+    only imported (and the value replaced with the class) the first
+    time the device is looked up, ie. when a query uses it.
+    """
+
+    def __getitem__(self, name):
+        value = dict.__getitem__(self, name)
+        if isinstance(value, basestring):
+            module_name, class_name = value.split(':')
+            module = importlib.import_module(module_name)
+            value = self[name] = getattr(module, class_name)
+        return value
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
 
 
 # todo: use entry points instead!
-DEVICES_REGISTER = {
-    'Filter': dq.piping.filter.Filter,
-    'Transform': dq.piping.filter.Transform,
-    'Map': dq.piping.filter.Map,
-    'List': dq.piping.filter.List,
-    'Dict': dq.piping.filter.Dict,
-    'InCSV': dq.piping.io_csv.InCSV,
-    'OutCSV': dq.piping.io_csv.OutCSV,
-    'InJSON': dq.piping.io_json.InJSON,
-    'OutJSON': dq.piping.io_json.OutJSON,
-}
+DEVICES_REGISTER = DeviceRegister({
+    'Filter': 'dq.piping.filter:Filter',
+    'Transform': 'dq.piping.filter:Transform',
+    'Map': 'dq.piping.filter:Map',
+    'List': 'dq.piping.filter:List',
+    'Dict': 'dq.piping.filter:Dict',
+    'Head': 'dq.piping.limit:Head',
+    'Sample': 'dq.piping.limit:Sample',
+    'Sort': 'dq.piping.sort:Sort',
+    'GroupBy': 'dq.piping.sort:GroupBy',
+    'Join': 'dq.piping.join:Join',
+    'Count': 'dq.piping.aggregate:Count',
+    'Sum': 'dq.piping.aggregate:Sum',
+    'Min': 'dq.piping.aggregate:Min',
+    'Max': 'dq.piping.aggregate:Max',
+    'Mean': 'dq.piping.aggregate:Mean',
+    'Variance': 'dq.piping.aggregate:Variance',
+    'TopK': 'dq.piping.aggregate:TopK',
+    'CountDistinct': 'dq.piping.aggregate:CountDistinct',
+    'Quantiles': 'dq.piping.aggregate:Quantiles',
+    'Fused': 'dq.piping.fused:Fused',
+    'ColumnarCSV': 'dq.piping.columnar:ColumnarCSV',
+    'InCSV': 'dq.piping.io_csv:InCSV',
+    'OutCSV': 'dq.piping.io_csv:OutCSV',
+    'InJSON': 'dq.piping.io_json:InJSON',
+    'InJSONArray': 'dq.piping.io_json:InJSONArray',
+    'InJSONLines': 'dq.piping.io_json:InJSONLines',
+    'OutJSON': 'dq.piping.io_json:OutJSON',
+    'OutJSONLines': 'dq.piping.io_json:OutJSONLines',
+})
 
 
 def get_device_instance(name, args, keywords):
@@ -28,13 +72,183 @@ def get_device_instance(name, args, keywords):
     return klass(*args, **keywords)
 
 
-def execute(obj, args=()):
+def _is_fusible(item):
+    if not isinstance(item, Device):
+        return False
+
+    # Avoid importing the fusion machinery for other devices
+    klass = DEVICES_REGISTER.get(item.name)
+    if getattr(klass, '__module__', None) != 'dq.piping.filter':
+        return False
+
+    import dq.piping.fused
+    return dq.piping.fused.is_fusible(item, DEVICES_REGISTER)
+
+
+def fuse_pipeline(pipe):
+    """
+    Replace runs of per-item devices (``Filter``, ``Map``,
+    ``Transform``) in a pipeline with a single ``Fused`` device.
+
+    Only the top level of the pipeline is processed: nested
+    pipelines will be fused when executed.
+    """
+
+    fused = Pipeline()
+    run = []
+
+    def _flush():
+        if len(run) > 1:
+            fused.append(Device('Fused', run, {}))
+        else:
+            fused.extend(run)
+        del run[:]
+
+    for item in pipe:
+        if _is_fusible(item):
+            run.append(item)
+        else:
+            _flush()
+            fused.append(item)
+    _flush()
+
+    return fused
+
+
+def columnar_pipeline(pipe):
+    """
+    Run an ``InCSV`` device at the start of the pipeline, and the
+    ``Filter`` / ``Map`` devices following it, on NumPy arrays
+    (see :py:mod:`dq.piping.columnar`).
+    """
+
+    # NumPy is an optional dependency: only import when needed
+    import dq.piping.columnar
+    return dq.piping.columnar.vectorize_pipeline(pipe, DEVICES_REGISTER)
+
+
+def optimize_pipeline(pipe):
+    """
+    Rewrite a pipeline into a faster equivalent one, eg. moving
+    filters first (see :py:mod:`dq.optimizer`).
+    """
+
+    import dq.optimizer
+    return dq.optimizer.optimize_pipeline(pipe, DEVICES_REGISTER)
+
+
+def execute(obj, args=(), optimize=True, fuse=True, batch_size=None,
+            columnar=False, block_mode=None, pipelined=False,
+            max_buffer=DEFAULT_MAX_BUFFER, queue_size=DEFAULT_QUEUE_SIZE,
+            profile=None):
     """
     Device -> <pyobj>
     PipelineBlock -> tuple
     Pipeline -> last return value
+
+    If ``optimize`` is True, pipelines are rewritten before being
+    run (see :py:func:`optimize_pipeline`).
+
+    If ``fuse`` is True, consecutive per-item devices in pipelines
+    will be run in a single loop (see :py:func:`fuse_pipeline`).
+
+    If ``batch_size`` is set (eg. 4096), devices supporting it will
+    exchange lists of ``batch_size`` items instead of single items
+    (see :py:class:`dq.piping.base.BatchStream`).
+
+    If ``columnar`` is True, filtering of CSV files will be vectorized
+    using NumPy, where possible (see :py:func:`columnar_pipeline`).
+
+    ``block_mode`` selects how pipelines in a block are run
+    (see :py:mod:`dq.blocks`):
+
+    - ``'lockstep'`` (the default) runs them concurrently, as
+      greenlets, buffering at most ``max_buffer`` items of each
+      input stream (``max_buffer=None`` means no limit)
+    - ``'tee'`` runs them one after the other, over ``itertools.tee``
+      copies of the input streams: faster, but memory usage grows
+      with the length of the streams
+    - ``'threads'`` runs them in threads, passing streams through
+      queues of at most ``queue_size`` items (the default, when
+      ``pipelined`` is True)
+
+    If ``pipelined`` is True, devices returning streams are run in
+    their own thread, passing items to the next device through a
+    queue of at most ``queue_size`` items (see
+    :py:func:`dq.blocks.run_stage`): a device waiting on I/O does
+    not stop the others. Items are passed by lists (see
+    :py:class:`dq.blocks.QueueTee`), batches one by one.
+
+    If ``profile`` is True, statistics are collected for each device
+    (see :py:mod:`dq.profiling`); streams in the result are consumed,
+    and the annotated plan is written to stderr. A
+    :py:class:`dq.profiling.Profile` object can be passed instead,
+    to be filled as the result is consumed.
     """
 
+    if block_mode is None:
+        block_mode = 'threads' if pipelined else 'lockstep'
+    if block_mode not in BLOCK_MODES:
+        raise ValueError("Unsupported block mode: {0!r}".format(block_mode))
+    if pipelined and block_mode == 'lockstep':
+        # Greenlets cannot be switched to from other threads
+        raise ValueError("Lockstep blocks cannot be pipelined")
+
+    options = {
+        'optimize': optimize,
+        'fuse': fuse,
+        'batch_size': batch_size,
+        'columnar': columnar,
+        'block_mode': block_mode,
+        'pipelined': pipelined,
+        'max_buffer': max_buffer,
+        'queue_size': queue_size,
+        'profile': None,
+    }
+
+    if not profile:
+        return _unwrap_batches(_execute(obj, args, options))
+
+    from dq import profiling
+    report = not isinstance(profile, profiling.Profile)
+    if report:
+        profile = profiling.Profile()
+    options['profile'] = profile
+
+    result = _unwrap_batches(_execute(obj, args, options))
+    if report:
+        result = profiling.materialize(result)
+        profile.report()
+    return result
+
+
+def _run_stages(result, queue_size):
+    if isinstance(result, tuple):
+        return tuple(run_stage(x, queue_size) for x in result)
+    return run_stage(result, queue_size)
+
+
+def _unwrap_batches(result):
+    if isinstance(result, BatchStream):
+        return result.items()
+    if isinstance(result, tuple):
+        return tuple(_unwrap_batches(x) for x in result)
+    return result
+
+
+def _to_batches(arg, batch_size):
+    if isinstance(arg, BatchStream):
+        return arg
+    return BatchStream(batched(arg, batch_size))
+
+
+def _from_batches(arg):
+    if isinstance(arg, BatchStream):
+        return arg.items()
+    return arg
+
+
+def _execute(obj, args, options):
     if isinstance(obj, Device):
         # To execute a device, we just pass it all
         # the arguments.
@@ -42,34 +256,40 @@ def execute(obj, args=()):
 
         _callable = get_device_instance(
             name=obj.name, args=obj.args, keywords=obj.keywords)
-        return _callable(*args)
+
+        # Adapt streams to what the device supports
+        batch_size = options['batch_size']
+        if batch_size and hasattr(_callable, 'call_batches'):
+            args = tuple(_to_batches(a, batch_size) for a in args)
+            function = functools.partial(_callable.call_batches, batch_size)
+        else:
+            args = tuple(_from_batches(a) for a in args)
+            function = _callable
+
+        if options['profile'] is not None:
+            from dq import profiling
+            node = options['profile'].child(profiling.device_label(obj))
+            return profiling.profile_call(node, function, args)
+        return function(*args)
 
     elif isinstance(obj, PipelineBlock):
         # We need to call all the contained pipelines,
         # passing arguments.
 
-        _args_matrix = []
-        _count = len(obj)
-        _results = []
-
-        for arg in args:
-            if inspect.isgenerator(arg):
-                # We need a generator for each pipeline
-                _args_matrix.append(itertools.tee(arg, _count))
+        if options['profile'] is not None:
+            options = dict(options, profile=options['profile'].child('Block'))
 
-            else:
-                # We just need to pass multiple copies
-                _args_matrix.append((arg,) * _count)
-
-        # We zip the matrix to have each row contain
-        # all the argument calls.
-        # We zip that together with obj to get a list
-        # of (pipe, args) tuples..
-        for pipe, args in zip(obj, zip(*_args_matrix)):
+        def _run(pipe, pipe_args):
             assert isinstance(pipe, Pipeline)
-            _results.append(execute(pipe, args))
+            return _execute(pipe, pipe_args, options)
 
-        return tuple(_results)
+        if options['block_mode'] == 'threads':
+            return run_block_threads(obj, args, _run,
+                                     queue_size=options['queue_size'])
+        if options['block_mode'] == 'tee':
+            return run_block_tee(obj, args, _run)
+        return run_block_lockstep(obj, args, _run,
+                                  max_buffer=options['max_buffer'])
 
     elif isinstance(obj, Pipeline):
         # We need to keep executing items in the pipeline
@@ -79,10 +299,24 @@ def execute(obj, args=()):
             args = ()
         wasblock = True  # we could have multiple inputs
 
-        for item in obj:
+        if options['profile'] is not None:
+            options = dict(options,
+                           profile=options['profile'].child('Pipeline'))
+
+        if options['optimize']:
+            obj = optimize_pipeline(obj)
+        if options['columnar']:
+            obj = columnar_pipeline(obj)
+        if options['fuse']:
+            obj = fuse_pipeline(obj)
+
+        for index, item in enumerate(obj):
             assert isinstance(item, (Device, PipelineBlock))
 
-            result = execute(item, args)
+            result = _execute(item, args, options)
+            if options['pipelined'] and index < len(obj) - 1:
+                # The last result is left to the caller
+                result = _run_stages(result, options['queue_size'])
 
             if isinstance(item, PipelineBlock):
                 # Args should be passed as-is to the next one
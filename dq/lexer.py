@@ -125,5 +125,7 @@ def t_pyargs_error(t):
 
 # ----------------------------------------------------------------------
 # todo: use some better way to enable partial debug modes
+# Lexer tables are shipped prebuilt, in ``dq/lextab.py``
+# (see ``dq.parser.write_tables()``).
 debug = True if os.environ.get('DQ_DEBUG') else False
-lexer = lex.lex(debug=debug)
+lexer = lex.lex(debug=debug, optimize=not debug, lextab='dq.lextab')
@@ -0,0 +1,10 @@
+# lextab.py. This file automatically created by PLY (version 3.11). Don't edit!
+_tabversion   = '3.10'
+_lextokens    = set(('COMMA', 'COMMENT', 'LBRACE', 'PIPE', 'PYARGS', 'PYEXPR', 'RBRACE', 'SYMBOL'))
+_lexreflags   = 64
+_lexliterals  = ''
+_lexstateinfo = {'INITIAL': 'inclusive', 'pyargs': 'exclusive'}
+_lexstatere   = {'INITIAL': [('(?P<t_newline>\\n+)|(?P<t_COMMENT>\\#.*)|(?P<t_pyargs>\\()|(?P<t_SYMBOL>[a-zA-Z_][a-zA-Z_0-9]*)|(?P<t_PIPE>\\|)|(?P<t_RBRACE>\\})|(?P<t_COMMA>\\,)|(?P<t_LBRACE>\\{)', [None, ('t_newline', 'newline'), ('t_COMMENT', 'COMMENT'), ('t_pyargs', 'pyargs'), (None, 'SYMBOL'), (None, 'PIPE'), (None, 'RBRACE'), (None, 'COMMA'), (None, 'LBRACE')])], 'pyargs': [('(?P<t_pyargs_LPAREN>\\()|(?P<t_pyargs_RPAREN>\\))|(?P<t_pyargs_STRING>\\"([^\\\\\\n]|(\\\\.))*?\\"|\\\'([^\\\\\\n]|(\\\\.))*?\\\')|(?P<t_pyargs_PYEXPR>[^\\(\\)\\\'\\"]+)', [None, ('t_pyargs_LPAREN', 'LPAREN'), ('t_pyargs_RPAREN', 'RPAREN'), ('t_pyargs_STRING', 'STRING'), None, None, None, None, ('t_pyargs_PYEXPR', 'PYEXPR')])]}
+_lexstateignore = {'INITIAL': ' \t', 'pyargs': ''}
+_lexstateerrorf = {'INITIAL': 't_error', 'pyargs': 't_pyargs_error'}
+_lexstateeoff = {}
@@ -0,0 +1,312 @@
+"""
+Rewriting of parsed pipelines into equivalent, faster ones.
+
+Rules, applied to the top level of a pipeline:
+
+- no-op devices are dropped: ``Filter(True)`` and ``Map(item)``,
+  following devices known to return generators (others might
+  return eg. a dict, which ``Map(item)`` turns into a stream of keys)
+- ``Filter`` devices are moved ahead of ``Transform`` devices not
+  setting the fields they read, and ahead of ``Map`` devices
+  building dicts out of fields of the items (the filter expression
+  is rewritten in terms of the original item)
+- consecutive ``Filter`` devices are merged in a single one,
+  testing the conjunction of their expressions
+- if rows read by ``InCSV`` are only used as ``item.<field>`` by the
+  ``Filter`` devices and ``Map`` following it, ``InCSV`` is told to
+  only keep these columns (its ``columns`` option)
+
+Expressions are assumed to have no side effects: filters being
+moved first, some expressions will not be evaluated anymore.
+"""
+
+from __future__ import absolute_import
+
+import ast
+import copy
+
+from dq.ast import Device, Expression, Pipeline, fold_constants
+from dq.piping.filter import Filter, Map, Transform
+
+
+# Devices returning generators, as ``module.Class`` names (not to
+# import their modules)
+_GENERATOR_DEVICES = frozenset([
+    'dq.piping.filter.Filter',
+    'dq.piping.filter.Map',
+    'dq.piping.filter.Transform',
+    'dq.piping.io_csv.InCSV',
+    'dq.piping.io_json.InJSONArray',
+    'dq.piping.io_json.InJSONLines',
+    'dq.piping.limit.Head',
+    'dq.piping.sort.GroupBy',
+    'dq.piping.sort.Sort',
+])
+
+
+def _is_item(node):
+    return isinstance(node, ast.Name) and node.id == 'item'
+
+
+def _item_key(node):
+    """Get ``key`` if ``node`` is ``item['key']``, else None"""
+
+    if isinstance(node, ast.Subscript) and _is_item(node.value) \
+            and isinstance(node.slice, ast.Index) \
+            and isinstance(node.slice.value, ast.Str):
+        return node.slice.value.s
+    return None
+
+
+def item_keys(node):
+    """
+    Get the set of keys read by an expression, as ``item['key']``;
+    None if ``item`` is used in any other way.
+    """
+
+    keys = set()
+    subscripts = names = 0
+    for child in ast.walk(node):
+        key = _item_key(child)
+        if key is not None:
+            keys.add(key)
+            subscripts += 1
+        elif _is_item(child):
+            names += 1
+    # Each item['key'] subscript contains an ``item`` name too
+    if names != subscripts:
+        return None
+    return keys
+
+
+def item_attributes(node):
+    """
+    Get the set of attributes read by an expression, as ``item.name``;
+    None if ``item`` is used in any other way (or for attributes
+    starting with an underscore, eg. namedtuple methods).
+    """
+
+    attributes = set()
+    accesses = names = 0
+    for child in ast.walk(node):
+        if isinstance(child, ast.Attribute) and _is_item(child.value):
+            if child.attr.startswith('_'):
+                return None
+            attributes.add(child.attr)
+            accesses += 1
+        elif _is_item(child):
+            names += 1
+    if names != accesses:
+        return None
+    return attributes
+
+
+def _is_simple(node):
+    """Check whether a node only reads constants or parts of ``item``"""
+
+    if _is_item(node) or isinstance(node, (ast.Num, ast.Str)):
+        return True
+    if isinstance(node, ast.Attribute):
+        return _is_simple(node.value)
+    if isinstance(node, ast.Subscript):
+        return (isinstance(node.slice, ast.Index) and
+                _is_simple(node.value) and _is_simple(node.slice.value))
+    return False
+
+
+def _dict_fields(node):
+    """
+    Get ``{key: node}`` for the fields of a ``{'key': value}`` or
+    ``dict(key=value)`` expression, else None.
+    """
+
+    if isinstance(node, ast.Dict):
+        if not all(isinstance(key, ast.Str) for key in node.keys):
+            return None
+        return dict((key.s, value)
+                    for key, value in zip(node.keys, node.values))
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+            and node.func.id == 'dict' and not node.args \
+            and not node.starargs and not node.kwargs:
+        return dict((k.arg, k.value) for k in node.keywords)
+
+    return None
+
+
+class _Substitute(ast.NodeTransformer):
+    def __init__(self, fields):
+        self.fields = fields
+
+    def visit_Subscript(self, node):
+        key = _item_key(node)
+        if key is None:
+            return self.generic_visit(node)
+        return copy.deepcopy(self.fields[key])
+
+
+class Optimizer(object):
+    """
+    Apply the optimization rules to pipelines. ``registry`` is used
+    to make sure device names refer to the standard devices.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def _is(self, device, klass):
+        return (isinstance(device, Device) and
+                self.registry.get(device.name) is klass)
+
+    def yields_generator(self, device):
+        if not isinstance(device, Device):
+            return False
+        klass = self.registry.get(device.name)
+        name = '{0}.{1}'.format(getattr(klass, '__module__', None),
+                                getattr(klass, '__name__', None))
+        return name in _GENERATOR_DEVICES
+
+    def is_noop(self, device):
+        """
+        Whether ``device`` passes a generator through unchanged;
+        ``Transform`` always builds new items (copies, by default).
+        """
+
+        if self._is(device, Filter) and not device.keywords:
+            node = fold_constants(device.args[0].node)
+            if isinstance(node, ast.Name) and node.id == 'True':
+                return True
+            if isinstance(node, ast.Num):
+                return bool(node.n)
+            if isinstance(node, ast.Str):
+                return bool(node.s)
+        if self._is(device, Map) and not device.keywords:
+            return _is_item(device.args[0].node)
+        return False
+
+    def push_filter(self, previous, device):
+        """
+        Get an equivalent of ``device`` (a ``Filter``) to be run
+        before ``previous``, or None if it can't be moved.
+        """
+
+        expr = device.args[0]
+        keys = item_keys(expr.node)
+        if keys is None:
+            return None
+
+        if self._is(previous, Transform):
+            if keys & (set(previous.keywords) - set(['copy'])):
+                return None
+            return device
+
+        if self._is(previous, Map) and not previous.keywords:
+            fields = _dict_fields(previous.args[0].node)
+            if fields is None or not keys <= set(fields) \
+                    or not all(_is_simple(fields[key]) for key in keys):
+                return None
+            node = _Substitute(fields).visit(copy.deepcopy(expr.node))
+            return Device(device.name, [Expression(node, expr.name)],
+                          device.keywords)
+
+        return None
+
+    def merge_filters(self, first, second):
+        """Merge two ``Filter`` devices, or return None"""
+
+        if first.keywords or second.keywords:
+            return None
+
+        values = []
+        for device in (first, second):
+            node = device.args[0].node
+            if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+                values.extend(node.values)
+            else:
+                values.append(node)
+
+        node = ast.BoolOp(op=ast.And(), values=values)
+        return Device(first.name, [Expression(node, first.args[0].name)], {})
+
+    def optimize(self, pipe):
+        """Get an optimized copy of ``pipe``"""
+
+        devices = []
+        for device in pipe:
+            if devices and self.yields_generator(devices[-1]) \
+                    and self.is_noop(device):
+                continue
+            devices.append(device)
+
+        # Move filters as early as possible
+        for index in xrange(len(devices)):
+            if not self._is(devices[index], Filter):
+                continue
+            while index > 0:
+                pushed = self.push_filter(devices[index - 1], devices[index])
+                if pushed is None:
+                    break
+                devices[index - 1:index + 1] = [pushed, devices[index - 1]]
+                index -= 1
+
+        optimized = Pipeline()
+        for device in devices:
+            if optimized and self._is(device, Filter) \
+                    and self._is(optimized[-1], Filter):
+                merged = self.merge_filters(optimized[-1], device)
+                if merged is not None:
+                    optimized[-1] = merged
+                    continue
+            optimized.append(device)
+
+        return self.project_columns(optimized)
+
+    def project_columns(self, pipe):
+        """Restrict the columns read by ``InCSV``, at the pipeline start"""
+
+        if not len(pipe) or not isinstance(pipe[0], Device):
+            return pipe
+        source = pipe[0]
+
+        # Avoid importing the CSV module for other devices
+        klass = self.registry.get(source.name)
+        if getattr(klass, '__module__', None) != 'dq.piping.io_csv':
+            return pipe
+        from dq.piping.io_csv import InCSV
+        keywords = source.keywords
+        if klass is not InCSV or 'columns' in keywords:
+            return pipe
+        if 'fieldnames' not in keywords and not (
+                'header' in keywords and keywords['header'].evaluate()):
+            # Columns are only known by name
+            return pipe
+
+        used = set()
+        for device in pipe[1:]:
+            if not (self._is(device, Filter) or self._is(device, Map)):
+                # Rows are used as a whole
+                return pipe
+            attributes = item_attributes(device.args[0].node)
+            if attributes is None:
+                return pipe
+            used |= attributes
+            if self._is(device, Map):
+                break
+        else:
+            # Rows are the pipeline output
+            return pipe
+
+        if not used:
+            return pipe
+        columns = ast.List(elts=[ast.Str(s=x) for x in sorted(used)],
+                           ctx=ast.Load())
+        keywords = dict(keywords, columns=Expression(columns))
+        projected = Pipeline(pipe)
+        projected[0] = Device(source.name, source.args, keywords)
+        return projected
+
+
+def optimize_pipeline(pipe, registry):
+    """Rewrite a pipeline (see :py:class:`Optimizer`)"""
+
+    return Optimizer(registry).optimize(pipe)
@@ -2,6 +2,7 @@ from __future__ import absolute_import
 
 import ast
 import os
+import sys
 
 import ply.yacc as yacc
 
@@ -161,5 +162,31 @@ def p_device(p):
 # Create the parser
 # ----------------------------------------------------------------------------
 
+# Parser tables are shipped prebuilt, in ``dq/parsetab.py``, and never
+# written at import time. If the grammar doesn't match their signature,
+# tables are rebuilt in memory; run ``write_tables()`` to update them.
+
 debug = True if os.environ.get('DQ_DEBUG') else False
-parser = yacc.yacc(debug=debug)
+parser = yacc.yacc(debug=debug, tabmodule='dq.parsetab', write_tables=False)
+
+
+def write_tables():
+    """Regenerate the lexer and parser tables shipped with dq"""
+
+    import dq.lexer
+    import ply.lex as lex
+
+    outputdir = os.path.dirname(os.path.abspath(__file__))
+
+    # Make sure existing tables are not loaded
+    for name in ('lextab', 'parsetab'):
+        sys.modules.pop('dq.' + name, None)
+        for ext in ('.py', '.pyc'):
+            path = os.path.join(outputdir, name + ext)
+            if os.path.exists(path):
+                os.unlink(path)
+
+    lex.lex(module=dq.lexer, optimize=True, lextab='dq.lextab',
+            outputdir=outputdir)
+    yacc.yacc(debug=False, tabmodule='dq.parsetab', outputdir=outputdir,
+              write_tables=True, optimize=False)
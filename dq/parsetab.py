@@ -0,0 +1,41 @@
+
+# parsetab.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'leftCOMMAleftPIPECOMMA COMMENT LBRACE PIPE PYARGS PYEXPR RBRACE SYMBOL\n    program : pipeline\n    \n    pipeline : pipeline_item\n    \n    pipeline : pipeline PIPE pipeline_item\n    \n    pipeline_item : block\n                  | device\n     block : LBRACE RBRACE \n    block : LBRACE block_content RBRACE\n          | LBRACE block_content COMMA RBRACE\n    \n    block_content : pipeline\n    \n    block_content : block_content COMMA pipeline\n    device : SYMBOL PYARGS'
+    
+_lr_action_items = {'LBRACE':([0,2,8,14,],[2,2,2,2,]),'RBRACE':([2,4,6,7,9,10,11,12,13,14,15,16,17,],[10,-2,-5,-4,-9,-6,15,-11,-3,17,-7,-10,-8,]),'SYMBOL':([0,2,8,14,],[3,3,3,3,]),'PYARGS':([3,],[12,]),'PIPE':([1,4,6,7,9,10,12,13,15,16,17,],[8,-2,-5,-4,8,-6,-11,-3,-7,8,-8,]),'COMMA':([4,6,7,9,10,11,12,13,15,16,17,],[-2,-5,-4,-9,-6,14,-11,-3,-7,-10,-8,]),'$end':([1,4,5,6,7,10,12,13,15,17,],[-1,-2,0,-5,-4,-6,-11,-3,-7,-8,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'pipeline':([0,2,14,],[1,9,16,]),'block_content':([2,],[11,]),'pipeline_item':([0,2,8,14,],[4,4,13,4,]),'program':([0,],[5,]),'device':([0,2,8,14,],[6,6,6,6,]),'block':([0,2,8,14,],[7,7,7,7,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> program","S'",1,None,None,None),
+  ('program -> pipeline','program',1,'p_program','parser.py',50),
+  ('pipeline -> pipeline_item','pipeline',1,'p_pipeline_single','parser.py',66),
+  ('pipeline -> pipeline PIPE pipeline_item','pipeline',3,'p_pipeline_append','parser.py',74),
+  ('pipeline_item -> block','pipeline_item',1,'p_pipeline_item','parser.py',84),
+  ('pipeline_item -> device','pipeline_item',1,'p_pipeline_item','parser.py',85),
+  ('block -> LBRACE RBRACE','block',2,'p_block_empty','parser.py',101),
+  ('block -> LBRACE block_content RBRACE','block',3,'p_block','parser.py',107),
+  ('block -> LBRACE block_content COMMA RBRACE','block',4,'p_block','parser.py',108),
+  ('block_content -> pipeline','block_content',1,'p_block_content_single','parser.py',115),
+  ('block_content -> block_content COMMA pipeline','block_content',3,'p_block_content_append','parser.py',122),
+  ('device -> SYMBOL PYARGS','device',2,'p_device','parser.py',134),
+]
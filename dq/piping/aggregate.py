@@ -0,0 +1,351 @@
+"""
+Aggregates, computed over a stream in a single pass, with bounded
+memory. Run several of them over one scan with a block:
+
+    InCSV('log.csv', header=True, types='infer')
+    | { Count(), Mean(item.latency), Quantiles(item.latency, [0.5, 0.99]) }
+
+Most aggregates accept an expression (with ``item`` as name), applied
+to items before aggregation; items themselves are used by default.
+Aggregates of empty streams are None (0 for ``Count`` and ``Sum``).
+
+``CountDistinct`` and ``Quantiles`` are approximate, using sketches
+of constant size (:py:class:`HyperLogLog` and :py:class:`TDigest`).
+"""
+
+from __future__ import absolute_import
+
+import bisect
+import heapq
+import itertools
+import math
+import operator
+from abc import abstractmethod
+
+from .base import BaseDevice
+
+
+class Aggregate(BaseDevice):
+    """Base for aggregates of (an expression of) the items"""
+
+    def __init__(self, expr=None):
+        self.expr = expr
+
+    def _values(self, stream):
+        if self.expr is None:
+            return stream
+        return itertools.imap(self.expr.function('item'), stream)
+
+    def __call__(self, stream):
+        return self.aggregate(self._values(stream))
+
+    @abstractmethod
+    def aggregate(self, values):
+        """Compute the aggregate of an iterable of values"""
+
+
+class Count(Aggregate):
+    """Count items (for which ``expr`` is true, if passed)"""
+
+    def aggregate(self, values):
+        if self.expr is None:
+            return sum(1 for _ in values)
+        return sum(1 for value in values if value)
+
+    def call_batches(self, batch_size, stream):
+        if self.expr is not None:
+            return self(stream.items())
+        return sum(len(batch) for batch in stream)
+
+
+class Sum(Aggregate):
+    def aggregate(self, values):
+        return sum(values)
+
+
+class Min(Aggregate):
+    def aggregate(self, values):
+        values = iter(values)
+        for first in values:
+            return min(itertools.chain([first], values))
+        return None
+
+
+class Max(Aggregate):
+    def aggregate(self, values):
+        values = iter(values)
+        for first in values:
+            return max(itertools.chain([first], values))
+        return None
+
+
+class Mean(Aggregate):
+    def aggregate(self, values):
+        count = 0
+        total = 0
+        for value in values:
+            count += 1
+            total += value
+        if not count:
+            return None
+        return float(total) / count
+
+
+class Variance(Aggregate):
+    """
+    Variance, computed with Welford's algorithm (numerically
+    stable); ``ddof=1`` (the default) gives the sample variance,
+    ``ddof=0`` the population variance.
+    """
+
+    def __init__(self, expr=None, ddof=None):
+        super(Variance, self).__init__(expr)
+        self.ddof = ddof.evaluate() if ddof is not None else 1
+
+    def aggregate(self, values):
+        count = 0
+        mean = m2 = 0.0
+        for value in values:
+            count += 1
+            delta = value - mean
+            mean += delta / count
+            m2 += delta * (value - mean)
+        if count <= self.ddof:
+            return None
+        return m2 / (count - self.ddof)
+
+
+class TopK(BaseDevice):
+    """
+    Get the ``k`` largest items (by ``key``, if passed), largest
+    first; only ``k`` items are held in memory.
+    """
+
+    def __init__(self, k, key=None):
+        self.k = k.evaluate()
+        self.key = key
+
+    def __call__(self, stream):
+        if self.key is None:
+            return heapq.nlargest(self.k, stream)
+        return heapq.nlargest(self.k, stream, key=self.key.function('item'))
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(value):
+    # Python hashes of small ints are the ints themselves: mix
+    # the bits (MurmurHash3 finalizer), for uniform registers.
+    h = hash(value) & _MASK64
+    h ^= h >> 33
+    h = (h * 0xff51afd7ed558ccd) & _MASK64
+    h ^= h >> 33
+    h = (h * 0xc4ceb9fe1a85ec53) & _MASK64
+    h ^= h >> 33
+    return h
+
+
+class HyperLogLog(object):
+    """
+    HyperLogLog cardinality sketch, with ``2 ** precision`` one-byte
+    registers; the relative error is about ``1.04 / sqrt(2 ** precision)``
+    (0.8% for the default precision of 14, using 16KB).
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("Precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        h = _hash64(value)
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        registers = self.registers
+        bits = 64 - self.precision
+        mask = (1 << bits) - 1
+        for value in values:
+            h = _hash64(value)
+            index = h >> bits
+            rank = bits - (h & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(b'\x00')
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction (linear counting)
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+
+class CountDistinct(Aggregate):
+    """Approximate number of distinct values (see :py:class:`HyperLogLog`)"""
+
+    def __init__(self, expr=None, precision=None):
+        super(CountDistinct, self).__init__(expr)
+        self.precision = precision.evaluate() if precision is not None else 14
+
+    def aggregate(self, values):
+        sketch = HyperLogLog(self.precision)
+        sketch.update(values)
+        return sketch.count()
+
+
+def _group_points(points):
+    """
+    Merge sorted ``(mean, weight, single)`` points having the same
+    mean, so that they end up in the same centroid.
+    """
+
+    for mean, group in itertools.groupby(points, operator.itemgetter(0)):
+        group = list(group)
+        if len(group) == 1:
+            yield group[0]
+        else:
+            yield (mean, sum(point[1] for point in group),
+                   all(point[2] for point in group))
+
+
+class TDigest(object):
+    """
+    Merging t-digest quantile sketch: values are summarized by at
+    most about ``compression`` centroids, smaller near the tails,
+    for accurate extreme quantiles.
+
+    Equal values are never split between centroids: for discrete
+    data, quantiles falling in a centroid holding a single value are
+    that value, instead of being interpolated with the neighbours.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.single = []  # Whether centroids hold a single value
+        self.count = 0
+        self.min = self.max = None
+        self._buffer = []
+        self._buffer_size = compression * 10
+
+    def add(self, value):
+        self._buffer.append(value)
+        if len(self._buffer) >= self._buffer_size:
+            self._merge()
+
+    def update(self, values):
+        values = iter(values)
+        while True:
+            self._buffer.extend(itertools.islice(
+                values, self._buffer_size - len(self._buffer)))
+            if len(self._buffer) < self._buffer_size:
+                return
+            self._merge()
+
+    def _scale(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _merge(self):
+        if not self._buffer:
+            return
+        buffer, self._buffer = sorted(self._buffer), []
+        if self.min is None or buffer[0] < self.min:
+            self.min = buffer[0]
+        if self.max is None or buffer[-1] > self.max:
+            self.max = buffer[-1]
+
+        points = _group_points(sorted(itertools.chain(
+            itertools.izip(self.means, self.weights, self.single),
+            itertools.izip(buffer, itertools.repeat(1),
+                           itertools.repeat(True)))))
+        self.count += len(buffer)
+        total = float(self.count)
+
+        means, weights, single = [], [], []
+        mean, weight, is_single = next(points)
+        done = 0
+        limit = self._scale(0) + 1
+        for point_mean, point_weight, point_single in points:
+            if self._scale((done + weight + point_weight) / total) <= limit:
+                # Same centroid
+                weight += point_weight
+                # Float division: items might be integers
+                mean += (point_mean - mean) * float(point_weight) / weight
+                is_single = False
+            else:
+                means.append(mean)
+                weights.append(weight)
+                single.append(is_single)
+                done += weight
+                limit = self._scale(done / total) + 1
+                mean, weight, is_single = (
+                    point_mean, point_weight, point_single)
+        means.append(mean)
+        weights.append(weight)
+        single.append(is_single)
+        self.means, self.weights, self.single = means, weights, single
+
+    def quantile(self, q):
+        """Estimate the ``q`` quantile (0 <= q <= 1), None if empty"""
+
+        self._merge()
+        if not self.count:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+
+        # Centroids are taken to be centered on their mean
+        target = q * self.count
+        starts = []
+        centers = []
+        cumulative = 0
+        for weight in self.weights:
+            starts.append(cumulative)
+            centers.append(cumulative + weight / 2.0)
+            cumulative += weight
+
+        index = max(bisect.bisect_right(starts, target) - 1, 0)
+        if self.single[index]:
+            return self.means[index]
+
+        if target <= centers[0]:
+            low, high = (0, self.min), (centers[0], self.means[0])
+        elif target >= centers[-1]:
+            low = (centers[-1], self.means[-1])
+            high = (self.count, self.max)
+        else:
+            index = bisect.bisect_right(centers, target)
+            low = (centers[index - 1], self.means[index - 1])
+            high = (centers[index], self.means[index])
+        if high[0] == low[0]:
+            return low[1]
+        fraction = (target - low[0]) / (high[0] - low[0])
+        return low[1] + fraction * (high[1] - low[1])
+
+
+class Quantiles(Aggregate):
+    """
+    Approximate quantiles, eg. ``Quantiles(item.latency, [0.5, 0.99])``,
+    returned as a list (see :py:class:`TDigest`).
+    """
+
+    def __init__(self, expr, quantiles, compression=None):
+        super(Quantiles, self).__init__(expr)
+        self.quantiles = quantiles.evaluate()
+        self.compression = (compression.evaluate()
+                            if compression is not None else 100)
+
+    def aggregate(self, values):
+        digest = TDigest(self.compression)
+        digest.update(values)
+        return [digest.quantile(q) for q in self.quantiles]
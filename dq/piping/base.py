@@ -1,7 +1,118 @@
 from __future__ import absolute_import
 
+import collections
+import itertools
 from abc import ABCMeta, abstractmethod
 
+from .compression import open_file, readahead
+
+
+def batched(stream, size):
+    """Split an iterable in lists of (at most) ``size`` items"""
+
+    stream = iter(stream)
+    while True:
+        batch = list(itertools.islice(stream, size))
+        if not batch:
+            return
+        yield batch
+
+
+def close_stream(stream):
+    """
+    Close a stream (eg. a generator), if it supports it: generators
+    up the pipeline are finalized, and sources close their files.
+    """
+
+    if isinstance(stream, BatchStream):
+        stream = stream.batches
+    close = getattr(stream, 'close', None)
+    if close is not None:
+        close()
+
+
+class BatchStream(object):
+    """
+    Stream of "batches" (lists of items), exchanged between devices
+    supporting the batched protocol, to pay the per-item overhead
+    once per batch.
+
+    Devices supporting it define a ``call_batches(batch_size, *args)``
+    method, accepting ``BatchStream`` objects instead of item streams.
+    The executor takes care of converting streams between batch-aware
+    and "legacy" devices.
+
+    Batches must be considered read-only, as they might be shared
+    between multiple consumers.
+    """
+
+    def __init__(self, batches):
+        self.batches = batches
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def items(self):
+        """Iterate single items from the batches"""
+
+        return itertools.chain.from_iterable(self.batches)
+
+
+_DELETED = object()
+
+
+class Overlay(collections.MutableMapping):
+    """
+    Copy-on-write view of a mapping: changes are stored on top of
+    the ``base`` mapping, which is left alone.
+
+    Nested values are shared with ``base``, as for a shallow copy.
+    """
+
+    __slots__ = ('base', 'changes')
+
+    def __init__(self, base, changes=None):
+        self.base = base
+        self.changes = {} if changes is None else changes
+
+    @classmethod
+    def over(cls, item):
+        """Get an overlay of ``item``, without stacking overlays"""
+
+        if isinstance(item, Overlay):
+            return cls(item.base, dict(item.changes))
+        return cls(item)
+
+    def __getitem__(self, key):
+        if key in self.changes:
+            value = self.changes[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        return self.base[key]
+
+    def __setitem__(self, key, value):
+        self.changes[key] = value
+
+    def __delitem__(self, key):
+        self[key]
+        self.changes[key] = _DELETED
+
+    def __iter__(self):
+        changes = self.changes
+        for key in self.base:
+            if key not in changes:
+                yield key
+        for key, value in changes.iteritems():
+            if value is not _DELETED:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'Overlay({0!r})'.format(dict(self))
+
 
 class BaseDevice(object):
     __metaclass__ = ABCMeta
@@ -19,26 +130,45 @@ class FileSource(BaseDevice):
     Base for devices reading from a file.
 
     Accepts a ``'name_or_fp'`` constructor argument and provides
-    a ``fp`` property to access the open file object.
+    a ``fp`` property to access the open file object. Compressed
+    files are decompressed on the fly (see :py:mod:`.compression`).
+
+    If ``readahead`` is passed (True, or a chunk size in bytes), the
+    file is read ahead by a background thread, while the device
+    parses the data already read.
     """
 
     _open_binary = True
     _openfile = None
     _name_or_fp = None
+    _readahead = False
 
-    def __init__(self, name_or_fp):
+    def __init__(self, name_or_fp, readahead=None):
         self._name_or_fp = name_or_fp.evaluate()
+        if readahead is not None:
+            self._readahead = readahead.evaluate()
 
     @property
     def fp(self):
         if self._openfile is None:
             if isinstance(self._name_or_fp, basestring):
                 mode = 'rb' if self._open_binary else 'r'
-                self._openfile = open(self._name_or_fp, mode)
+                self._openfile = open_file(self._name_or_fp, mode,
+                                           readahead=self._readahead)
+            elif self._readahead:
+                self._openfile = readahead(self._name_or_fp,
+                                           self._readahead)
             else:
                 self._openfile = self._name_or_fp
         return self._openfile
 
+    def close(self):
+        """Close the file, unless it was passed open"""
+
+        openfile, self._openfile = self._openfile, None
+        if openfile is not None and openfile is not self._name_or_fp:
+            openfile.close()
+
 
 class FileSink(BaseDevice):
     """
@@ -46,9 +176,14 @@ class FileSink(BaseDevice):
 
     Accepts a ``'name_or_fp'`` constructor argument and provides
     a ``fp`` property to access the open file object.
+
+    Files opened by name use a ``_buffering``-sized buffer
+    (see :py:func:`open`), and are compressed according to their
+    extension (see :py:mod:`.compression`).
     """
 
     _open_binary = True
+    _buffering = -1
     _openfile = None
     _name_or_fp = None
 
@@ -60,7 +195,15 @@ class FileSink(BaseDevice):
         if self._openfile is None:
             if isinstance(self._name_or_fp, basestring):
                 mode = 'wb' if self._open_binary else 'w'
-                self._openfile = open(self._name_or_fp, mode)
+                self._openfile = open_file(self._name_or_fp, mode,
+                                           self._buffering)
             else:
                 self._openfile = self._name_or_fp
         return self._openfile
+
+    def close(self):
+        """Close (and flush) the file, unless it was passed open"""
+
+        openfile, self._openfile = self._openfile, None
+        if openfile is not None and openfile is not self._name_or_fp:
+            openfile.close()
@@ -0,0 +1,380 @@
+"""
+Background reading and transparent (de)compression of files.
+
+The compression format is detected from the file name extension or, for regular
+files being read, from their first bytes. Data is (de)compressed in
+a background thread, a few chunks ahead of the reader (or behind the
+writer), so that it overlaps with parsing: zlib and bz2 release the
+GIL while working.
+
+Uncompressed files can be read ahead in the same way (see
+:py:func:`readahead`), for I/O to overlap with parsing.
+
+``.zst`` files require the ``zstandard`` package, and ``.xz`` files
+the ``lzma`` module (``backports.lzma`` on Python 2).
+"""
+
+from __future__ import absolute_import
+
+import bz2
+import collections
+import io
+import itertools
+import os
+import Queue
+import re
+import sys
+import threading
+import zlib
+
+import six
+
+
+CHUNK_SIZE = 1 << 20
+
+# Chunks read ahead of the reader / compressed behind the writer
+QUEUE_SIZE = 4
+
+_DATA, _END, _ERROR = 'data', 'end', 'error'
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The zstandard package is required "
+                          "for .zst files")
+    return zstandard
+
+
+def _lzma():
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise ImportError("The lzma module (backports.lzma on "
+                              "Python 2) is required for .xz files")
+    return lzma
+
+
+# ``magic`` is a compiled pattern matching the first bytes of files
+Codec = collections.namedtuple(
+    'Codec', 'name extensions magic decompressor compressor')
+
+CODECS = [
+    Codec('gzip', ('.gz',), re.compile(b'\x1f\x8b'),
+          lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+          lambda: zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)),
+    # Block size, then a block or the end of stream (empty data)
+    Codec('bz2', ('.bz2',), re.compile(b'BZh[1-9](?:1AY&SY|\x17rE8P\x90)'),
+          bz2.BZ2Decompressor, bz2.BZ2Compressor),
+    Codec('zstd', ('.zst', '.zstd'),
+          re.compile(re.escape(b'\x28\xb5\x2f\xfd')),
+          lambda: _zstandard().ZstdDecompressor().decompressobj(),
+          lambda: _zstandard().ZstdCompressor().compressobj()),
+    Codec('xz', ('.xz',), re.compile(re.escape(b'\xfd7zXZ\x00')),
+          lambda: _lzma().LZMADecompressor(),
+          lambda: _lzma().LZMACompressor()),
+]
+
+# Enough bytes for all the patterns
+_MAGIC_SIZE = 10
+
+
+def detect(name, reading=True):
+    """
+    Get the :py:class:`Codec` for a file, or None if it is not
+    compressed. When ``reading``, regular files not having a known
+    extension are recognized by their first bytes.
+    """
+
+    extension = os.path.splitext(name)[1].lower()
+    for codec in CODECS:
+        if extension in codec.extensions:
+            return codec
+
+    # Don't consume data from pipes and devices
+    if not reading or not os.path.isfile(name):
+        return None
+    with open(name, 'rb') as fp:
+        header = fp.read(_MAGIC_SIZE)
+    for codec in CODECS:
+        if codec.magic.match(header):
+            return codec
+    return None
+
+
+def _put(queue, message, stop):
+    # Give up when the reader went away
+    while not stop.is_set():
+        try:
+            queue.put(message, timeout=0.1)
+        except Queue.Full:
+            continue
+        return True
+    return False
+
+
+def _read(fp, codec, queue, stop, chunk_size, close):
+    try:
+        decompressor = codec.decompressor() if codec is not None else None
+        while True:
+            data = fp.read(chunk_size)
+            if not data:
+                break
+            if decompressor is None:
+                if not _put(queue, (_DATA, data), stop):
+                    return
+                continue
+            # Concatenated streams (eg. appended gzip members) are
+            # left as "unused data" by the decompressor.
+            while data:
+                try:
+                    chunk = decompressor.decompress(data)
+                except EOFError:
+                    # The previous stream ended with the last read
+                    decompressor = codec.decompressor()
+                    continue
+                data = getattr(decompressor, 'unused_data', b'')
+                if data:
+                    decompressor = codec.decompressor()
+                if chunk and not _put(queue, (_DATA, chunk), stop):
+                    return
+        _put(queue, (_END, None), stop)
+    except Exception:
+        _put(queue, (_ERROR, sys.exc_info()), stop)
+    finally:
+        if close:
+            fp.close()
+
+
+def _split_lines(data):
+    # Split after '\n' only, like file iteration
+    if data.count('\r') == data.count('\r\n'):
+        return data.splitlines(True)
+    lines = [line + '\n' for line in data.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+class _ThreadedReader(object):
+    """
+    Read-only file object over chunks read (and decompressed, if
+    ``codec`` is not None) by a background thread.
+
+    Lines are split a chunk at a time when iterating; as for Python 2
+    files, the object is its own (single) iterator, and iteration and
+    read methods should not be mixed.
+    """
+
+    def __init__(self, fp, codec, chunk_size, queue_size=QUEUE_SIZE,
+                 close=True):
+        self._queue = Queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._buffer = b''
+        self._pos = 0
+        self._eof = False
+        self._lines = None
+        self._owns_file = close
+        self.closed = False
+        # The thread must not reference this object, for it to be
+        # closed when garbage collected.
+        self._thread = threading.Thread(
+            target=_read,
+            args=(fp, codec, self._queue, self._stop, chunk_size, close))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _next_chunk(self):
+        """Get the next chunk of data, or an empty string at the end"""
+
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if self._eof:
+            return b''
+        kind, value = self._queue.get()
+        if kind == _DATA:
+            return value
+        self._eof = True
+        if kind == _ERROR:
+            six.reraise(*value)
+        return b''
+
+    def _take(self):
+        data = self._buffer[self._pos:]
+        self._buffer, self._pos = b'', 0
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = [self._take()]
+            for chunk in iter(self._next_chunk, b''):
+                chunks.append(chunk)
+            return b''.join(chunks)
+
+        if self._pos + size > len(self._buffer):
+            chunks = [self._take()]
+            available = len(chunks[0])
+            while available < size:
+                chunk = self._next_chunk()
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                available += len(chunk)
+            self._buffer = b''.join(chunks)
+        data = self._buffer[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
+
+    def readline(self):
+        end = self._buffer.find('\n', self._pos)
+        while end < 0:
+            chunk = self._next_chunk()
+            if not chunk:
+                return self._take()
+            self._buffer = self._take() + chunk
+            end = self._buffer.find('\n')
+        line = self._buffer[self._pos:end + 1]
+        self._pos = end + 1
+        return line
+
+    def _line_lists(self):
+        tail = self._take()
+        while True:
+            chunk = self._next_chunk()
+            if not chunk:
+                if tail:
+                    yield [tail]
+                return
+            lines = _split_lines(tail + chunk)
+            tail = lines.pop() if not lines[-1].endswith('\n') else b''
+            yield lines
+
+    def __iter__(self):
+        # Every iteration must go on from the same buffer position
+        if self._lines is None:
+            self._lines = itertools.chain.from_iterable(self._line_lists())
+        return self._lines
+
+    def next(self):
+        return next(iter(self))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # Unblock the thread, and wait for it to release the file
+        # (files passed open, eg. pipes, might block it forever).
+        self._stop.set()
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Queue.Empty:
+            pass
+        if self._owns_file:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def _compress(fp, compressor, queue, errors):
+    # After an error, keep reading the queue, not to block the writer
+    while True:
+        data = queue.get()
+        if errors:
+            if data is None:
+                return
+            continue
+        try:
+            if data is None:
+                fp.write(compressor.flush())
+                fp.close()
+                return
+            fp.write(compressor.compress(data))
+        except Exception:
+            errors.append(sys.exc_info())
+
+
+class _CompressingWriter(io.RawIOBase):
+    """Raw stream passing data to a compressing background thread"""
+
+    def __init__(self, fp, compressor, queue_size=QUEUE_SIZE):
+        self._queue = Queue.Queue(queue_size)
+        self._errors = []
+        self._thread = threading.Thread(
+            target=_compress,
+            args=(fp, compressor, self._queue, self._errors))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def writable(self):
+        return True
+
+    def _check(self):
+        if self._errors:
+            six.reraise(*self._errors[0])
+
+    def write(self, data):
+        self._check()
+        self._queue.put(memoryview(data).tobytes())
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._queue.put(None)
+            self._thread.join()
+            self._check()
+        finally:
+            super(_CompressingWriter, self).close()
+
+
+def _chunk_size(readahead):
+    # ``readahead`` is True, or a chunk size in bytes
+    return CHUNK_SIZE if readahead is True else int(readahead)
+
+
+def readahead(fp, size=True):
+    """
+    Wrap an open file, reading it ahead in a background thread,
+    by chunks of ``size`` bytes (``True`` for the default size).
+    The file is left open.
+    """
+
+    return _ThreadedReader(fp, None, _chunk_size(size), close=False)
+
+
+def open_file(name, mode='rb', buffering=-1, readahead=False):
+    """
+    Open a file by name, like :py:func:`open`, (de)compressing
+    its contents if needed (see :py:func:`detect`).
+
+    Files being read are read ahead by a background thread if
+    they are compressed, or if ``readahead`` is set (to True, or
+    a chunk size in bytes).
+    """
+
+    reading = 'r' in mode
+    codec = detect(name, reading)
+
+    if reading and (codec is not None or readahead):
+        return _ThreadedReader(open(name, 'rb'), codec,
+                               _chunk_size(readahead or True))
+    if codec is None:
+        return open(name, mode, buffering)
+
+    compressor = codec.compressor()
+    raw = _CompressingWriter(open(name, 'wb'), compressor)
+    return io.BufferedWriter(raw, CHUNK_SIZE)
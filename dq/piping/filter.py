@@ -1,37 +1,125 @@
-from .base import BaseDevice
+from .base import BaseDevice, BatchStream, Overlay, batched
 
 import copy
 
 
-class Filter(BaseDevice):
-    def __init__(self, condition):
-        self.condition = condition
+# How Transform copies items before setting fields
+COPY_MODES = {
+    'deep': copy.deepcopy,
+    'shallow': copy.copy,
+    'overlay': Overlay.over,
+    'none': None,
+}
+
+
+class ParallelDevice(BaseDevice):
+    """
+    Base for devices evaluating an expression on each item, which
+    can be run in a pool of processes by passing ``workers=N``.
+
+    Output order is preserved, unless ``ordered=False`` is passed.
+    """
+
+    _kind = None
+
+    def __init__(self, expr, workers=None, ordered=None):
+        self.expr = expr
+        self.workers = workers.evaluate() if workers is not None else None
+        self.ordered = ordered.evaluate() if ordered is not None else True
+
+    def _parallel(self, stream):
+        # Importing multiprocessing is not free, do it only if needed
+        from .parallel import parallel_apply
+        return parallel_apply(self._kind, self.expr, stream, self.workers,
+                              ordered=self.ordered)
+
+    def _parallel_batches(self, batch_size, stream):
+        return BatchStream(
+            batched(self._parallel(stream.items()), batch_size))
+
+
+class Filter(ParallelDevice):
+    _kind = 'filter'
 
     def __call__(self, stream):
+        if self.workers:
+            return self._parallel(stream)
+        return self._filter(stream)
+
+    def _filter(self, stream):
+        condition = self.expr.function('item')
         for item in stream:
-            if self.condition.evaluate({'item': item}):
+            if condition(item):
                 yield item
 
+    def call_batches(self, batch_size, stream):
+        if self.workers:
+            return self._parallel_batches(batch_size, stream)
+        condition = self.expr.function('item')
+        batches = (filter(condition, batch) for batch in stream)
+        return BatchStream(batch for batch in batches if batch)
+
 
 class Transform(BaseDevice):
-    def __init__(self, **kwargs):
+    """
+    Set fields on each item, eg. ``Transform(total=item['price'] * 2)``.
+
+    Items are deep-copied first, unless another ``copy`` mode is
+    passed (so ``copy`` cannot be used as a field name):
+
+    - ``'shallow'``: nested values are shared with the original item
+    - ``'overlay'``: items become :py:class:`dq.piping.base.Overlay`
+      objects, only holding the new fields on top of the original
+    - ``'none'``: items are modified in place
+    """
+
+    def __init__(self, copy=None, **kwargs):
+        self.copy = copy.evaluate() if copy is not None else 'deep'
+        if self.copy not in COPY_MODES:
+            raise ValueError("Invalid copy mode: {0!r}".format(self.copy))
         self.kwargs = kwargs
 
+    def _make_transform(self):
+        functions = [(name, expr.function('item'))
+                     for name, expr in self.kwargs.iteritems()]
+        copy_item = COPY_MODES[self.copy]
+
+        def transform(item):
+            _item = copy_item(item) if copy_item is not None else item
+            for name, func in functions:
+                _item[name] = func(_item)
+            return _item
+
+        return transform
+
     def __call__(self, stream):
+        transform = self._make_transform()
         for item in stream:
-            _item = copy.deepcopy(item)
-            for name, expr in self.kwargs.iteritems():
-                _item[name] = expr.evaluate({'item': _item})
-            yield _item
+            yield transform(item)
 
+    def call_batches(self, batch_size, stream):
+        transform = self._make_transform()
+        return BatchStream(map(transform, batch) for batch in stream)
 
-class Map(BaseDevice):
-    def __init__(self, expr):
-        self.expr = expr
+
+class Map(ParallelDevice):
+    _kind = 'map'
 
     def __call__(self, stream):
+        if self.workers:
+            return self._parallel(stream)
+        return self._map(stream)
+
+    def _map(self, stream):
+        func = self.expr.function('item')
         for item in stream:
-            yield self.expr.evaluate({'item': item})
+            yield func(item)
+
+    def call_batches(self, batch_size, stream):
+        if self.workers:
+            return self._parallel_batches(batch_size, stream)
+        func = self.expr.function('item')
+        return BatchStream(map(func, batch) for batch in stream)
 
 
 class List(BaseDevice):
@@ -0,0 +1,164 @@
+"""
+Fused per-item devices.
+
+A run of ``Filter`` / ``Map`` / ``Transform`` devices in a pipeline
+can be merged into a single device, running a single generated
+loop with the expressions code inlined, instead of stacking one
+generator (and one ``eval()`` call per expression) for each device.
+"""
+
+from __future__ import absolute_import
+
+import ast
+
+from dq.ast import EXPRESSION_GLOBALS, fold_constants
+from .base import BaseDevice, BatchStream
+from .filter import COPY_MODES, Filter, Map, Transform
+
+
+# Locals other than ``item`` must not be visible to the expressions
+_FUSED_TEMPLATE = """
+def _dq_fused(_dq_stream):
+    for item in _dq_stream:
+        yield item
+"""
+
+
+def _load_item():
+    return ast.Name(id='item', ctx=ast.Load())
+
+
+def _store_item():
+    return ast.Name(id='item', ctx=ast.Store())
+
+
+def _rebinds_item(node):
+    """
+    Check whether an expression assigns ``item``: Python 2 list
+    comprehensions leak their variables into the fused loop.
+    """
+
+    return any(isinstance(child, ast.Name) and child.id == 'item' and
+               isinstance(child.ctx, ast.Store)
+               for child in ast.walk(node))
+
+
+def _save_item():
+    return ast.Assign(targets=[ast.Name(id='_dq_item', ctx=ast.Store())],
+                      value=_load_item())
+
+
+def _restore_item():
+    return ast.Assign(targets=[_store_item()],
+                      value=ast.Name(id='_dq_item', ctx=ast.Load()))
+
+
+def _filter_statements(device):
+    condition, = device.args
+    node = fold_constants(condition.node)
+    test = ast.UnaryOp(op=ast.Not(), operand=node)
+    statements = [ast.If(test=test, body=[ast.Continue()], orelse=[])]
+    if _rebinds_item(node):
+        statements = [_save_item()] + statements + [_restore_item()]
+    return statements
+
+
+def _map_statements(device):
+    expr, = device.args
+    return [ast.Assign(targets=[_store_item()],
+                       value=fold_constants(expr.node))]
+
+
+def _transform_statements(device):
+    keywords = dict(device.keywords)
+    mode = keywords.pop('copy', None)
+    mode = mode.evaluate() if mode is not None else 'deep'
+
+    statements = []
+    if COPY_MODES[mode] is not None:
+        func = ast.Name(id='_dq_copy_' + mode, ctx=ast.Load())
+        statements.append(ast.Assign(
+            targets=[_store_item()],
+            value=ast.Call(func=func, args=[_load_item()], keywords=[],
+                           starargs=None, kwargs=None)))
+
+    for name, expr in keywords.iteritems():
+        node = fold_constants(expr.node)
+        target = ast.Subscript(value=_load_item(),
+                               slice=ast.Index(value=ast.Str(s=name)),
+                               ctx=ast.Store())
+        if not _rebinds_item(node):
+            statements.append(ast.Assign(targets=[target], value=node))
+            continue
+        # The value is computed before the target is looked up
+        target.value = ast.Name(id='_dq_item', ctx=ast.Load())
+        statements.extend([_save_item(),
+                           ast.Assign(targets=[target], value=node),
+                           _restore_item()])
+    return statements
+
+
+# name -> (device class, function generating the loop statements)
+FUSIBLE_DEVICES = {
+    'Filter': (Filter, _filter_statements),
+    'Map': (Map, _map_statements),
+    'Transform': (Transform, _transform_statements),
+}
+
+
+def is_fusible(device, registry):
+    """
+    Check whether a parsed device can be fused, using ``registry``
+    to make sure its name refers to the standard device.
+    """
+
+    fusible = FUSIBLE_DEVICES.get(device.name)
+    if fusible is None or registry.get(device.name) is not fusible[0]:
+        return False
+    if device.name in ('Filter', 'Map') and device.keywords:
+        # Options such as ``workers=`` are not supported
+        return False
+    if device.name == 'Transform' and 'copy' in device.keywords:
+        return device.keywords['copy'].evaluate() in COPY_MODES
+    return True
+
+
+class Fused(BaseDevice):
+    """
+    Run a sequence of per-item devices in a single loop.
+
+    Unlike other devices, the constructor accepts the parsed
+    :py:class:`dq.ast.Device` objects to be fused, instead of
+    expressions.
+    """
+
+    def __init__(self, *devices):
+        self.devices = devices
+        self.function = self._build()
+
+    def _build(self):
+        module = ast.parse(_FUSED_TEMPLATE)
+        loop = module.body[0].body[0]
+
+        body = []
+        for device in self.devices:
+            _, statements = FUSIBLE_DEVICES[device.name]
+            body.extend(statements(device))
+        loop.body[0:0] = body
+
+        ast.fix_missing_locations(module)
+        code = compile(module, '<fused>', 'exec')
+
+        scope = dict(EXPRESSION_GLOBALS)
+        for mode, func in COPY_MODES.iteritems():
+            scope['_dq_copy_' + mode] = func
+        exec code in scope
+        return scope['_dq_fused']
+
+    def __call__(self, stream):
+        return self.function(stream)
+
+    def call_batches(self, batch_size, stream):
+        function = self.function
+        batches = (list(function(batch)) for batch in stream)
+        return BatchStream(batch for batch in batches if batch)
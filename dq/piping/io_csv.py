@@ -1,15 +1,241 @@
 import csv
 import collections
+import cStringIO
+import functools
+import itertools
+import marshal
+import mmap
+import operator
+import os
+import re
 
-from .base import FileSource, FileSink
+from .base import FileSource, FileSink, BatchStream, batched
+from .compression import detect
+
+# Size of the chunks parsed by each worker, in parallel mode
+PARALLEL_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Rows written with each writerows() call, by OutCSV
+WRITE_BATCH_SIZE = 1024
+
+# Number of lines used to infer column types, with ``types='infer'``
+INFER_SAMPLE_SIZE = 100
+
+# With ``columns``, lines are split with str.split() instead of
+# csv.reader when at least this many columns (and half of them) can
+# be skipped: the Python loop costs more than parsing a few fields.
+SPLIT_MIN_SKIPPED = 8
 
 # todo: figure out a nice way to load field names from file
 #       while allowing user to pass them by hand too..
 
 
+def split_records(data, chunk_size, quotechar='"'):
+    """
+    Split ``data`` (a string or mmap) in ``(start, end)`` ranges of
+    about ``chunk_size`` bytes, ending at record boundaries: newlines
+    preceded by an even number of ``quotechar`` (so not inside a
+    quoted field). Pass ``quotechar=None`` if quotes are not special.
+    """
+
+    size = len(data)
+    start = 0
+    while start < size:
+        end = start
+        quotes = 0
+        while True:
+            newline = data.find('\n', max(end, start + chunk_size - 1))
+            if newline < 0:
+                end = size
+                break
+            if quotechar is not None:
+                quotes += data[end:newline + 1].count(quotechar)
+            end = newline + 1
+            if not quotes % 2:
+                break
+        yield start, end
+        start = end
+
+
+_CONVERT_LINE_TEMPLATE = """
+def convert_line(line):
+    if len(line) > {last}:
+{conversions}
+    else:
+        # Short line, convert the fields it has
+        for position, convert in converters:
+            if position < len(line):
+                value = line[position]
+                line[position] = convert(value) if value != '' else None
+    return line
+"""
+
+
+def make_line_converter(converters):
+    """
+    Build a function converting fields of a parsed line, in place;
+    ``converters`` is a list of ``(position, convert)`` tuples.
+    Empty fields become ``None``.
+
+    The function is generated as a flat sequence of conversions,
+    to avoid looping over converters for each line.
+    """
+
+    namespace = {'converters': converters}
+    conversions = []
+    for position, convert in converters:
+        namespace['convert_{0}'.format(position)] = convert
+        conversions.append(
+            '        value = line[{0}]\n'
+            '        line[{0}] = convert_{0}(value) if value != \'\' '
+            'else None'.format(position))
+
+    code = _CONVERT_LINE_TEMPLATE.format(
+        last=max(position for position, _ in converters),
+        conversions='\n'.join(conversions))
+    exec code in namespace
+    return namespace['convert_line']
+
+
+# Eg. zip codes or identifiers, whose zeros would be lost
+_LEADING_ZERO = re.compile(r'\s*[+-]?0\d')
+
+_DIGIT = re.compile(r'\d')
+
+
+def _check_number(convert, value):
+    convert(value)
+    if _LEADING_ZERO.match(value) or not _DIGIT.search(value):
+        # Leading zeros, or 'nan' / 'inf'
+        raise ValueError(value)
+
+
+def infer_types(lines, width):
+    """
+    Guess column types from a sample of lines: ``int`` or ``float``
+    if all the non-empty values can be converted, else ``None``
+    (meaning: leave the column alone). Values with leading zeros,
+    or without digits (eg. ``'nan'``), are not taken as numbers.
+    """
+
+    types = []
+    for position in xrange(width):
+        values = [line[position] for line in lines
+                  if position < len(line) and line[position] != '']
+        for convert in (int, float):
+            try:
+                for value in values:
+                    _check_number(convert, value)
+            except ValueError:
+                continue
+            if values:
+                types.append(convert)
+                break
+        else:
+            types.append(None)
+    return types
+
+
+def _parse_range(args):
+    # Run in worker processes (see InCSV._parallel_reader)
+    filename, start, end, conf = args
+    try:
+        with open(filename, 'rb') as fp:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                chunk = data[start:end]
+            finally:
+                data.close()
+        # Pickling lists of strings is slow, marshal is much faster
+        lines = list(csv.reader(cStringIO.StringIO(chunk), **conf))
+        return True, marshal.dumps(lines)
+    except Exception as e:
+        return False, e
+
+
+class _Feed(object):
+    """Iterator over ``lines``, in which lines can be pushed back"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.pushed = []
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.pushed:
+            return self.pushed.pop()
+        return next(self.lines)
+
+
+def _can_split_fields(dialect, width, total):
+    skipped = total - width
+    if skipped < SPLIT_MIN_SKIPPED or skipped < width:
+        return False
+    return (dialect.escapechar is None and not dialect.skipinitialspace and
+            dialect.quoting != csv.QUOTE_NONNUMERIC)
+
+
+def split_fields(lines, width, conf):
+    """
+    Parse CSV ``lines``, only keeping the first ``width`` fields.
+
+    Lines without quotes are split with ``str.split()``, stopping
+    after ``width`` fields; other lines (which might span multiple
+    lines) are parsed by ``csv.reader``.
+    """
+
+    lines = iter(lines)
+    feed = _Feed(lines)
+    reader = csv.reader(feed, **conf)
+    delimiter = reader.dialect.delimiter
+    quotechar = reader.dialect.quotechar
+
+    for line in lines:
+        if quotechar in line:
+            feed.pushed.append(line)
+            yield next(reader)
+            continue
+        line = line.rstrip('\r\n')
+        yield line.split(delimiter, width)[:width] if line else []
+
+
+def _column_position(fieldnames, column):
+    if fieldnames is None or column not in fieldnames:
+        raise ValueError("Unknown column: {0!r}".format(column))
+    return fieldnames.index(column)
+
+
 class InCSV(FileSource):
-    def __init__(self, csvfile, fieldnames=None, header=None, **kw):
-        super(InCSV, self).__init__(csvfile)
+    """
+    Read rows from a CSV file.
+
+    If ``workers=N`` is passed (and the source is a file name), the
+    file is memory-mapped, split in chunks at record boundaries,
+    and parsed in a pool of ``N`` processes; rows are still yielded
+    in order. Splitting assumes quote characters only appear in
+    quoted fields (as written by ``csv.writer``); dialects with an
+    ``escapechar`` are parsed sequentially.
+
+    If ``types`` is passed, columns are converted once, when lines
+    are parsed: either a ``{column: type}`` dict (columns given by
+    name or position, types being any callable, eg. ``float``), or
+    ``'infer'`` to guess ``int`` / ``float`` columns from the first
+    lines. Empty fields of typed columns become ``None``.
+
+    If ``columns`` is passed (a list of field names), rows only
+    hold these columns, and lines are only parsed up to the last
+    of them (the optimizer sets it, from the fields used by the
+    pipeline, see :py:mod:`dq.optimizer`).
+
+    ``readahead`` is handled by :py:class:`.base.FileSource` (it has
+    no effect on parallel parsing).
+    """
+
+    def __init__(self, csvfile, fieldnames=None, header=None, workers=None,
+                 types=None, columns=None, readahead=None, **kw):
+        super(InCSV, self).__init__(csvfile, readahead)
 
         # If ``header=True``, the first line will be used as
         # field headers.
@@ -21,10 +247,60 @@ class InCSV(FileSource):
         self._csv_fieldnames = (fieldnames.evaluate()
                                 if fieldnames is not None else None)
 
+        self._workers = workers.evaluate() if workers is not None else None
+        self._types = types.evaluate() if types is not None else None
+        self._columns = columns.evaluate() if columns is not None else None
         self._conf = dict((k, v.evaluate()) for k, v in kw.iteritems())
 
-    def __call__(self):
-        reader = csv.reader(self.fp, **self._conf)
+    def _can_split(self):
+        if not self._workers or not isinstance(self._name_or_fp, basestring):
+            return False
+        if detect(self._name_or_fp) is not None:
+            # Compressed files can't be split
+            return False
+        dialect = csv.reader([], **self._conf).dialect
+        return dialect.escapechar is None
+
+    def _parallel_reader(self):
+        """Iterate lines parsed by worker processes"""
+
+        from .parallel import parallel_chunks
+
+        filename = self._name_or_fp
+        if not os.path.getsize(filename):
+            return
+        dialect = csv.reader([], **self._conf).dialect
+        quotechar = (dialect.quotechar
+                     if dialect.quoting != csv.QUOTE_NONE else None)
+
+        with open(filename, 'rb') as fp:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            ranges = split_records(data, PARALLEL_CHUNK_SIZE, quotechar)
+            chunks = parallel_chunks(
+                _parse_range, ranges, self._workers,
+                pack=lambda bounds: (filename,) + bounds + (self._conf,))
+            for lines in chunks:
+                for line in marshal.loads(lines):
+                    yield line
+        finally:
+            data.close()
+
+    def _reader(self):
+        """
+        Get a ``(reader, fieldnames, make_row)`` tuple, ``make_row``
+        being the function building a row from a parsed line.
+        """
+
+        parallel = self._can_split()
+        if parallel:
+            reader = self._parallel_reader()
+        else:
+            # The header and the other lines must be read through the
+            # same iterator (it is not the file itself for every file
+            # object).
+            lines = iter(self.fp)
+            reader = csv.reader(lines, **self._conf)
         fieldnames = None
 
         if self._csv_header:
@@ -33,29 +309,173 @@ class InCSV(FileSource):
         elif self._csv_fieldnames:
             fieldnames = tuple(self._csv_fieldnames)
 
-        if fieldnames is not None:
-            row_factory = collections.namedtuple('row', fieldnames)
+        positions = None
+        if self._columns is not None:
+            positions = [_column_position(fieldnames, column)
+                         for column in self._columns]
+            width = max(positions) + 1
+            if not parallel and _can_split_fields(
+                    reader.dialect, width, len(fieldnames)):
+                # Don't parse the columns after the last needed one
+                reader = split_fields(lines, width, self._conf)
+
+        if self._types is not None:
+            reader = self._typed(reader, fieldnames, positions)
+
+        if positions is not None:
+            # Only keep the needed columns (lines are only passed to
+            # make_row(): a one-item slice avoids a Python function).
+            if len(positions) == 1:
+                position, = positions
+                getter = operator.itemgetter(slice(position, position + 1))
+            else:
+                getter = operator.itemgetter(*positions)
+            reader = itertools.imap(getter, reader)
+            fieldnames = tuple(self._columns)
+
+        if fieldnames is None:
+            make_row = tuple
+        elif positions is not None:
+            # Lines have the right length, don't check it as _make()
+            # does: this is a C call, paying for the projection.
+            make_row = functools.partial(
+                tuple.__new__, collections.namedtuple('row', fieldnames))
+        else:
+            make_row = collections.namedtuple('row', fieldnames)._make
+
+        return reader, fieldnames, make_row
+
+    def _converters(self, reader, fieldnames, positions=None):
+        """
+        Get a ``(reader, [(position, converter), ...])`` tuple,
+        only for ``positions`` if not None.
+        """
+
+        if self._types == 'infer':
+            sample = list(itertools.islice(reader, INFER_SAMPLE_SIZE))
+            reader = itertools.chain(sample, reader)
+            width = max(map(len, sample)) if sample else 0
+            types = enumerate(infer_types(sample, width))
         else:
-            row_factory = lambda *a: tuple(a)
+            types = []
+            for column, convert in self._types.iteritems():
+                if isinstance(column, basestring):
+                    column = _column_position(fieldnames, column)
+                types.append((column, convert))
+
+        converters = sorted((position, convert)
+                            for position, convert in types
+                            if convert is not None and
+                            (positions is None or position in positions))
+        return reader, converters
+
+    def _typed(self, reader, fieldnames, positions=None):
+        # Lines are fresh lists from the reader, they can be updated
+        reader, converters = self._converters(reader, fieldnames, positions)
+        if not converters:
+            return reader
+        return itertools.imap(make_line_converter(converters), reader)
 
+    def __call__(self):
         # This method needs to be a generator..
-        for line in reader:
-            yield row_factory(*line)
+        try:
+            reader, _, make_row = self._reader()
+            for line in reader:
+                yield make_row(line)
+        finally:
+            self.close()
+
+    def call_batches(self, batch_size):
+        return BatchStream(self._iter_batches(batch_size))
+
+    def _iter_batches(self, batch_size):
+        try:
+            reader, _, make_row = self._reader()
+            for lines in batched(reader, batch_size):
+                yield map(make_row, lines)
+        finally:
+            self.close()
 
 
 class OutCSV(FileSink):
-    def __init__(self, csvfile, fieldnames=None, autoheader=False, **kw):
+    """
+    Write rows to a CSV file, in batches of ``WRITE_BATCH_SIZE``
+    rows (files opened by name use a 1MB buffer).
+
+    Rows can be sequences, namedtuples or mappings (eg. dicts). If
+    ``fieldnames`` is passed, namedtuple and mapping rows are written
+    with their columns in that order. If ``autoheader`` is true, a
+    header line is written first: ``fieldnames``, or else the first
+    row's namedtuple fields or mapping keys.
+
+    The column layout is computed from the first row only, all the
+    rows are expected to have the same fields.
+    """
+
+    _buffering = 1024 * 1024
+
+    def __init__(self, csvfile, fieldnames=None, autoheader=None, **kw):
         super(OutCSV, self).__init__(csvfile)
 
-        self._csv_autoheader = autoheader
-        self._fieldnames = fieldnames
-        self._conf = kw
+        self._csv_autoheader = (autoheader.evaluate()
+                                if autoheader is not None else False)
+        self._fieldnames = (tuple(fieldnames.evaluate())
+                            if fieldnames is not None else None)
+        self._conf = dict((k, v.evaluate()) for k, v in kw.iteritems())
 
-    def __call__(self, stream):
-        # todo: how to handle autoheader? (to handle properly
-        #       we lose asynchronousness..)
-        # todo: use correct order if a header is specified..
+    def _layout(self, row):
+        """
+        Get a ``(header, getter)`` tuple for rows like ``row``;
+        ``getter`` extracts fields in output order (None if rows
+        can be written as they are).
+        """
+
+        if isinstance(row, collections.Mapping):
+            names = self._fieldnames or tuple(row)
+            return names, _itemgetter(names)
 
+        fields = getattr(row, '_fields', None)
+        if fields is None or self._fieldnames is None:
+            return self._fieldnames or fields, None
+
+        if tuple(fields) == self._fieldnames:
+            return self._fieldnames, None
+        positions = [fields.index(name) for name in self._fieldnames]
+        return self._fieldnames, _itemgetter(positions)
+
+    def _write_batches(self, batches):
         writer = csv.writer(self.fp, **self._conf)
-        for row in stream:
-            writer.writerow(row)
+
+        # The first row tells how to write the following ones
+        batches = iter(batches)
+        for batch in batches:
+            if batch:
+                break
+        else:
+            return
+        header, getter = self._layout(batch[0])
+
+        if self._csv_autoheader and header is not None:
+            writer.writerow(header)
+        for batch in itertools.chain([batch], batches):
+            writer.writerows(batch if getter is None else map(getter, batch))
+
+    def __call__(self, stream):
+        try:
+            self._write_batches(batched(stream, WRITE_BATCH_SIZE))
+        finally:
+            self.close()
+
+    def call_batches(self, batch_size, stream):
+        try:
+            self._write_batches(stream)
+        finally:
+            self.close()
+
+
+def _itemgetter(keys):
+    # Like operator.itemgetter(), always returning tuples
+    if len(keys) == 1:
+        key, = keys
+        return lambda row: (row[key],)
+    return operator.itemgetter(*keys)
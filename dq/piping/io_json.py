@@ -1,13 +1,204 @@
+"""
+JSON input / output devices.
+
+``InJSON`` and ``OutJSON`` read and write whole JSON documents;
+``InJSONArray`` parses a top-level array incrementally, yielding its
+elements one at a time, and ``OutJSON`` writes streams as arrays,
+item by item. ``InJSONLines`` / ``OutJSONLines`` handle JSON Lines
+files (one JSON document per line).
+"""
+
+from __future__ import absolute_import
+
+import codecs
+import collections
 import json
 
-from .base import FileSource, FileSink
+from .base import FileSource, FileSink, BatchStream
+
+READ_SIZE = 65536
+
+_WHITESPACE = ' \t\n\r'
+
+_DELIMITERS = _WHITESPACE + ',]'
+
+
+def _default(obj):
+    # Mappings other than dicts, eg. Overlay items from Transform
+    if isinstance(obj, collections.Mapping):
+        return dict(obj)
+    raise TypeError("{0!r} is not JSON serializable".format(obj))
 
 
 class InJSON(FileSource):
     def __call__(self):
-        return json.load(self.fp)
+        try:
+            return json.load(self.fp)
+        finally:
+            self.close()
+
+
+class _Buffer(object):
+    """Read buffer for :py:class:`InJSONArray`"""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.data = u''
+        self.pos = 0
+        self.eof = False
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def fill(self, size=None):
+        """Drop consumed data and read more; False at end of file"""
+
+        chunk = self.fp.read(size or READ_SIZE)
+        # Decoded chunks can be empty (eg. a split UTF-8 character),
+        # only an empty read is the end of the file.
+        self.eof = not chunk
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk, final=self.eof)
+        self.data = self.data[self.pos:] + chunk
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        """Skip whitespace, and get the next character"""
+
+        while True:
+            while self.pos < len(self.data) \
+                    and self.data[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.data):
+                return self.data[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON data")
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError("Expecting one of {0!r}, got {1!r}"
+                             .format(chars, char))
+        self.pos += 1
+        return char
+
+    def decode(self, decoder):
+        self.peek()
+        size = READ_SIZE
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.data, self.pos)
+            except ValueError:
+                if not self.fill(size):
+                    raise
+            else:
+                # Values not followed by a delimiter (eg. numbers, at
+                # the end of the buffer) might be truncated: decode
+                # them again with more data.
+                if self.eof or (end < len(self.data) and
+                                self.data[end] in _DELIMITERS):
+                    self.pos = end
+                    return value
+                self.fill(size)
+            # Read more and more, not to decode large values too often
+            size *= 2
+
+
+class InJSONArray(FileSource):
+    """
+    Yield the elements of a top-level JSON array, without loading
+    the whole file: memory usage is bound by the size of the largest
+    element.
+    """
+
+    def __call__(self):
+        decoder = json.JSONDecoder()
+        try:
+            buf = _Buffer(self.fp)
+            buf.expect('[')
+            if buf.peek() == ']':
+                return
+            while True:
+                yield buf.decode(decoder)
+                if buf.expect(',]') == ']':
+                    return
+        finally:
+            self.close()
+
+
+class InJSONLines(FileSource):
+    """Yield the documents from a JSON Lines file, skipping blank lines"""
+
+    def __call__(self):
+        loads = json.loads
+        try:
+            for line in self.fp:
+                if line.strip():
+                    yield loads(line)
+        finally:
+            self.close()
+
+    def call_batches(self, batch_size):
+        return BatchStream(self._iter_batches(batch_size))
+
+    def _iter_batches(self, batch_size):
+        loads = json.loads
+        batch = []
+        try:
+            for line in self.fp:
+                if line.strip():
+                    batch.append(loads(line))
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+            if batch:
+                yield batch
+        finally:
+            self.close()
 
 
 class OutJSON(FileSink):
+    """
+    Write an object as JSON; streams (iterators) are written as
+    arrays, item by item, as they arrive.
+    """
+
     def __call__(self, obj):
-        return json.dump(obj, self.fp)
+        try:
+            self._write(obj)
+        finally:
+            self.close()
+
+    def _write(self, obj):
+        if not isinstance(obj, collections.Iterator):
+            return json.dump(obj, self.fp, default=_default)
+
+        write = self.fp.write
+        encode = json.JSONEncoder(default=_default).encode
+        separator = '['
+        for item in obj:
+            write(separator)
+            write(encode(item))
+            separator = ',\n'
+        write(']' if separator != '[' else '[]')
+
+
+class OutJSONLines(FileSink):
+    """Write items to a JSON Lines file, one per line"""
+
+    def __call__(self, stream):
+        write = self.fp.write
+        encode = json.JSONEncoder(default=_default).encode
+        try:
+            for item in stream:
+                write(encode(item) + '\n')
+        finally:
+            self.close()
+
+    def call_batches(self, batch_size, stream):
+        encode = json.JSONEncoder(default=_default).encode
+        try:
+            for batch in stream:
+                self.fp.write(''.join(encode(item) + '\n'
+                                      for item in batch))
+        finally:
+            self.close()
@@ -5,4 +5,7 @@ from .base import FileSource
 
 class InXML(FileSource):
     def __call__(self):
-        return lxml.html.fromstring(self.fp.read())
+        try:
+            return lxml.html.fromstring(self.fp.read())
+        finally:
+            self.close()
@@ -0,0 +1,167 @@
+"""
+Hash join of two streams, eg. the outputs of a block:
+
+    { InCSV('a.csv', header=True), InCSV('b.csv', header=True) }
+    | Join(left_key=item.id, right_key=item.a_id)
+
+Both inputs are read alternately, until one of them ends: the
+smaller one is loaded in a hash table (the "build" side), and the
+other one streamed through it (the "probe" side).
+
+If both inputs hold more than ``build_size`` items, they are split
+in partitions by key hash, spilled to temporary files, and each pair
+of partitions is joined in the same way ("grace" hash join), possibly
+partitioning again, up to ``MAX_DEPTH`` times.
+"""
+
+from __future__ import absolute_import
+
+import itertools
+
+from .base import BaseDevice
+from .spill import SpillFile
+
+
+DEFAULT_BUILD_SIZE = 1000000
+
+PARTITIONS = 16
+
+# Partitioning levels for large inputs; past that (eg. for a
+# single, huge key), the build side is loaded in memory anyway.
+MAX_DEPTH = 3
+
+_READ_SIZE = 1024
+
+JOIN_TYPES = ('inner', 'left', 'right', 'outer')
+
+
+class _Side(object):
+    """One of the inputs of a join, with the items read so far"""
+
+    def __init__(self, stream, key, keep, is_left):
+        self.stream = iter(stream)
+        self.key = key
+        self.keep = keep
+        self.is_left = is_left
+        self.buffer = []
+        self.done = False
+
+    def read(self):
+        chunk = list(itertools.islice(self.stream, _READ_SIZE))
+        self.buffer.extend(chunk)
+        self.done = len(chunk) < _READ_SIZE
+
+    def items(self):
+        return itertools.chain(self.buffer, self.stream)
+
+    def with_stream(self, stream):
+        return _Side(stream, self.key, self.keep, self.is_left)
+
+
+def _pair(probe, probe_item, build_item):
+    if probe.is_left:
+        return probe_item, build_item
+    return build_item, probe_item
+
+
+def _hash_join(probe, build):
+    table = {}
+    key = build.key
+    for item in build.buffer:
+        table.setdefault(key(item), []).append(item)
+    build.buffer = None
+
+    matched = set()
+    key = probe.key
+    for item in probe.items():
+        k = key(item)
+        matches = table.get(k)
+        if matches is not None:
+            for match in matches:
+                yield _pair(probe, item, match)
+            if build.keep:
+                matched.add(k)
+        elif probe.keep:
+            yield _pair(probe, item, None)
+
+    if build.keep:
+        for k, items in table.iteritems():
+            if k not in matched:
+                for item in items:
+                    yield _pair(probe, None, item)
+
+
+def _partition(side, depth):
+    partitions = [SpillFile() for _ in xrange(PARTITIONS)]
+    key = side.key
+    for item in side.items():
+        partitions[hash((depth, key(item))) % PARTITIONS].append(item)
+    return partitions
+
+
+def join(left, right, build_size=DEFAULT_BUILD_SIZE, depth=0):
+    """
+    Join two :py:class:`_Side` objects, yielding ``(left, right)``
+    item tuples (with None for unmatched items, in outer joins).
+    """
+
+    while not (left.done or right.done):
+        if len(left.buffer) >= build_size and len(right.buffer) >= build_size:
+            break
+        for side in (left, right):
+            if len(side.buffer) < build_size:
+                side.read()
+
+    finished = [side for side in (left, right) if side.done]
+    if finished or depth >= MAX_DEPTH:
+        sides = finished or [left, right]
+        build = min(sides, key=lambda side: len(side.buffer))
+        probe = right if build is left else left
+        if not build.done:
+            build.buffer = list(build.items())
+        for pair in _hash_join(probe, build):
+            yield pair
+        return
+
+    left_parts = _partition(left, depth)
+    right_parts = _partition(right, depth)
+    try:
+        for left_part, right_part in zip(left_parts, right_parts):
+            pairs = join(left.with_stream(left_part),
+                         right.with_stream(right_part),
+                         build_size, depth + 1)
+            for pair in pairs:
+                yield pair
+    finally:
+        for part in left_parts + right_parts:
+            part.close()
+
+
+class Join(BaseDevice):
+    """
+    Join two streams on ``left_key`` / ``right_key`` (evaluated with
+    ``item`` as name), yielding ``(left, right)`` item tuples.
+
+    ``how`` is one of ``'inner'`` (the default), ``'left'``,
+    ``'right'`` or ``'outer'``; for unmatched items, the other side
+    is None. Output order is not defined.
+
+    At most ``build_size`` items of each input are held in memory
+    (see :py:mod:`dq.piping.join`).
+    """
+
+    def __init__(self, left_key, right_key, how=None, build_size=None):
+        self.left_key = left_key
+        self.right_key = right_key
+        self.how = how.evaluate() if how is not None else 'inner'
+        if self.how not in JOIN_TYPES:
+            raise ValueError("Invalid join type: {0!r}".format(self.how))
+        self.build_size = (build_size.evaluate() if build_size is not None
+                           else DEFAULT_BUILD_SIZE)
+
+    def __call__(self, left, right):
+        left = _Side(left, self.left_key.function('item'),
+                     self.how in ('left', 'outer'), True)
+        right = _Side(right, self.right_key.function('item'),
+                      self.how in ('right', 'outer'), False)
+        return join(left, right, self.build_size)
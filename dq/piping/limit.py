@@ -0,0 +1,88 @@
+"""
+Devices keeping a part of a stream: the first items (``Head``), or
+a random sample of them (``Sample``).
+"""
+
+from __future__ import absolute_import
+
+import itertools
+import math
+import random
+
+from .base import BaseDevice, BatchStream, close_stream
+
+
+class Head(BaseDevice):
+    """
+    Yield the first ``n`` items, then close the input stream without
+    reading further: generators up the pipeline are finalized, and
+    sources close their files (see :py:func:`.base.close_stream`).
+    """
+
+    def __init__(self, n):
+        self.n = n.evaluate()
+
+    def __call__(self, stream):
+        try:
+            for item in itertools.islice(stream, self.n):
+                yield item
+        finally:
+            close_stream(stream)
+
+    def call_batches(self, batch_size, stream):
+        return BatchStream(self._iter_batches(stream))
+
+    def _iter_batches(self, stream):
+        remaining = self.n
+        try:
+            for batch in (stream if remaining > 0 else ()):
+                if len(batch) >= remaining:
+                    yield batch[:remaining]
+                    return
+                remaining -= len(batch)
+                yield batch
+        finally:
+            close_stream(stream)
+
+
+def _uniform(rnd):
+    # In (0, 1), for logarithms
+    while True:
+        value = rnd.random()
+        if value:
+            return value
+
+
+class Sample(BaseDevice):
+    """
+    Get a list of ``n`` items picked uniformly at random (all of
+    them, for shorter streams), with reservoir sampling: only ``n``
+    items are held in memory. Pass ``seed`` for repeatable samples.
+
+    Items not picked are skipped in batches ("Algorithm L"), not to
+    draw a random number for each of them.
+    """
+
+    def __init__(self, n, seed=None):
+        self.n = n.evaluate()
+        self.seed = seed.evaluate() if seed is not None else None
+
+    def __call__(self, stream):
+        rnd = random.Random(self.seed)
+        stream = iter(stream)
+        n = self.n
+        reservoir = list(itertools.islice(stream, n))
+        if len(reservoir) < n or not n:
+            return reservoir
+
+        w = math.exp(math.log(_uniform(rnd)) / n)
+        missing = object()
+        while True:
+            # w rounds to 1 for huge samples and unlucky draws
+            skip = (int(math.log(_uniform(rnd)) / math.log1p(-w))
+                    if w < 1 else 0)
+            item = next(itertools.islice(stream, skip, None), missing)
+            if item is missing:
+                return reservoir
+            reservoir[rnd.randrange(n)] = item
+            w *= math.exp(math.log(_uniform(rnd)) / n)
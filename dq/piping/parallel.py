@@ -0,0 +1,137 @@
+"""
+Evaluation of per-item expressions in a pool of processes.
+
+The input stream is split in chunks, which are sent to worker
+processes for evaluation; results are then reassembled, in the
+original order unless asked otherwise.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import multiprocessing
+
+from .base import batched
+from .spill import pack_items, unpack_items
+
+
+DEFAULT_CHUNK_SIZE = 1024
+
+# State of worker processes, set by _init_worker()
+_worker_kind = None
+_worker_function = None
+
+
+def _init_worker(kind, expr):
+    global _worker_kind, _worker_function
+    _worker_kind = kind
+    _worker_function = expr.function('item')
+
+
+def _work(packed):
+    # Map results are packed as the input items, eg. namedtuple
+    # rows could not be pickled back otherwise.
+    try:
+        items = unpack_items(packed)
+        if _worker_kind == 'filter':
+            return True, [bool(_worker_function(x)) for x in items]
+        return True, pack_items(map(_worker_function, items))
+    except Exception as e:
+        return False, e
+
+
+def _dispatch(pool, chunks, ordered, window, func=_work, pack=pack_items):
+    """
+    Send chunks to the pool, keeping at most ``window`` of them
+    in flight; yields ``(chunk, result)`` tuples.
+
+    Chunks are passed to ``func`` (which must return a ``(success,
+    value)`` tuple) in the workers, after conversion by ``pack``.
+    """
+
+    # Results are waited for with AsyncResult.get(), which raises
+    # errors happening outside ``func`` too (eg. results failing to
+    # be pickled), while callbacks would just never be called.
+    pending = collections.OrderedDict()
+    chunks = enumerate(chunks)
+    exhausted = False
+
+    while True:
+        while not exhausted and len(pending) < window:
+            try:
+                index, chunk = next(chunks)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[index] = chunk, pool.apply_async(func, (pack(chunk),))
+
+        if not pending:
+            return
+
+        index = next(iter(pending)) if ordered else _first_ready(pending)
+        chunk, result = pending.pop(index)
+        success, value = result.get()
+        if not success:
+            raise value
+        yield chunk, value
+
+
+def _first_ready(pending):
+    """Get the index of the first chunk whose result is ready"""
+
+    while True:
+        for index, (_, result) in pending.iteritems():
+            if result.ready():
+                return index
+        # Wait for the oldest one, a little
+        next(pending.itervalues())[1].wait(0.01)
+
+
+def parallel_apply(kind, expr, stream, workers, ordered=True,
+                   chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Apply an expression to the items in ``stream``, using a pool
+    of ``workers`` processes.
+
+    :param kind: ``'filter'`` to yield items for which the
+        expression is true, or ``'map'`` to yield the
+        expression results.
+    :param expr: the :py:class:`dq.ast.Expression` to apply
+        (shipped to workers by pickling its AST).
+    :param ordered: whether to keep the input order. If False,
+        chunks are yielded as soon as they are ready.
+    """
+
+    pool = multiprocessing.Pool(workers, _init_worker, (kind, expr))
+    try:
+        results = _dispatch(pool, batched(stream, chunk_size),
+                            ordered, window=workers * 2)
+        for chunk, result in results:
+            if kind == 'filter':
+                for item, keep in zip(chunk, result):
+                    if keep:
+                        yield item
+            else:
+                for value in unpack_items(result):
+                    yield value
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def parallel_chunks(func, chunks, workers, pack=None):
+    """
+    Run ``func`` on each chunk in a pool of ``workers`` processes,
+    yielding results in order. ``func`` must return a ``(success,
+    value)`` tuple, ``value`` being the exception on failure.
+    """
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = _dispatch(pool, chunks, True, window=workers * 2,
+                            func=func, pack=pack or (lambda x: x))
+        for _, result in results:
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,147 @@
+"""
+Sorting and grouping of streams larger than memory.
+
+Items are sorted in runs of at most ``run_size`` items; if the stream
+doesn't fit in a single run, sorted runs are spilled to temporary
+files (see :py:class:`.spill.SpillFile`) and merged back as a stream,
+so that only one run is held in memory at a time.
+"""
+
+from __future__ import absolute_import
+
+import heapq
+import itertools
+
+from .base import BaseDevice, BatchStream, batched
+from .spill import SpillFile
+
+
+DEFAULT_RUN_SIZE = 1000000
+
+
+class _Reversed(object):
+    """Key wrapper, inverting comparisons (for ``reverse=True``)"""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return self.key != other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+def _decorated(run, index, key, reverse):
+    # Runs with lower indexes come first for equal keys: the
+    # merge is stable, as the in-memory sort.
+    wrap = _Reversed if reverse else None
+    for item in run:
+        k = key(item) if key is not None else item
+        yield (wrap(k) if wrap else k), index, item
+
+
+def external_sort(stream, key=None, reverse=False,
+                  run_size=DEFAULT_RUN_SIZE):
+    """
+    Sort an iterable like :py:func:`sorted`, yielding items and
+    spilling sorted runs of ``run_size`` items to disk if needed.
+    """
+
+    stream = iter(stream)
+    runs = []
+    try:
+        pending = []
+        while True:
+            run = pending + list(
+                itertools.islice(stream, run_size - len(pending)))
+            run.sort(key=key, reverse=reverse)
+            pending = list(itertools.islice(stream, 1))
+            if not pending:
+                # The last run is merged from memory
+                break
+            runs.append(SpillFile(run))
+            run = None
+
+        if not runs:
+            # Everything fits in memory
+            for item in run:
+                yield item
+            return
+
+        merged = heapq.merge(*[
+            _decorated(items, index, key, reverse)
+            for index, items in enumerate(runs + [run])])
+        for _, _, item in merged:
+            yield item
+    finally:
+        for spilled in runs:
+            spilled.close()
+
+
+def _run_size(run_size):
+    if run_size is None:
+        return DEFAULT_RUN_SIZE
+    value = run_size.evaluate()
+    if value < 1:
+        raise ValueError("run_size must be at least 1, got {0!r}"
+                         .format(value))
+    return value
+
+
+class Sort(BaseDevice):
+    """
+    Sort items, eg. ``Sort(item.price, reverse=True)``; items
+    themselves are compared if no ``key`` is passed.
+
+    At most ``run_size`` items are kept in memory, sorted runs being
+    spilled to temporary files and merged (see :py:func:`external_sort`).
+    """
+
+    def __init__(self, key=None, reverse=None, run_size=None):
+        self.key = key
+        self.reverse = reverse.evaluate() if reverse is not None else False
+        self.run_size = _run_size(run_size)
+
+    def __call__(self, stream):
+        key = self.key.function('item') if self.key is not None else None
+        return external_sort(stream, key, self.reverse, self.run_size)
+
+    def call_batches(self, batch_size, stream):
+        return BatchStream(batched(self(stream.items()), batch_size))
+
+
+class GroupBy(BaseDevice):
+    """
+    Group items by key, eg. ``GroupBy(item.user)``, yielding
+    ``(key, items)`` tuples in key order, ``items`` being the list
+    of the items with that key, in their original order.
+
+    If ``agg`` is passed, it is evaluated for each group, with ``key``
+    and ``items`` as names, eg. ``GroupBy(item.user, agg=len(items))``,
+    and ``(key, value)`` tuples are yielded.
+
+    Items are sorted first (see :py:class:`Sort`, for ``run_size``):
+    groups, not the whole stream, must fit in memory.
+    """
+
+    def __init__(self, key, agg=None, run_size=None):
+        self.key = key
+        self.agg = agg
+        self.run_size = _run_size(run_size)
+
+    def __call__(self, stream):
+        key = self.key.function('item')
+        agg = self.agg.function('key', 'items') if self.agg else None
+        items = external_sort(stream, key, run_size=self.run_size)
+        for value, group in itertools.groupby(items, key):
+            group = list(group)
+            yield value, (agg(value, group) if agg is not None else group)
+
+    def call_batches(self, batch_size, stream):
+        return BatchStream(batched(self(stream.items()), batch_size))
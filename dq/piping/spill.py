@@ -0,0 +1,101 @@
+"""
+Serialization of item streams, to be sent to worker processes or
+spilled to temporary files by devices handling more data than fits
+in memory (eg. ``Sort``).
+"""
+
+from __future__ import absolute_import
+
+import collections
+import cPickle as pickle
+import tempfile
+
+from .base import batched
+
+
+SPILL_BATCH_SIZE = 1024
+
+# Namedtuple classes rebuilt when unpacking, by field names
+_namedtuples = {}
+
+
+def pack_items(items):
+    """
+    Prepare a list of items to be pickled.
+
+    Namedtuple classes created on the fly (eg. by ``InCSV``) cannot
+    be pickled, so lists of namedtuples are packed as field names
+    plus plain tuples.
+    """
+
+    if not items:
+        return None, items
+    klass = type(items[0])
+    fields = getattr(klass, '_fields', None)
+    if fields is not None and all(type(x) is klass for x in items):
+        return fields, [tuple(x) for x in items]
+    return None, items
+
+
+def unpack_items(packed):
+    """Get back the items packed by :py:func:`pack_items`"""
+
+    fields, items = packed
+    if fields is None:
+        return items
+    klass = _namedtuples.get(fields)
+    if klass is None:
+        klass = _namedtuples[fields] = collections.namedtuple('row', fields)
+    return [klass._make(x) for x in items]
+
+
+class SpillFile(object):
+    """
+    Items written to an anonymous temporary file, in pickled
+    batches, to be read back once written (only one iteration at
+    a time is supported).
+    """
+
+    def __init__(self, items=()):
+        self._fp = tempfile.TemporaryFile()
+        self._batch = []
+        self.count = 0
+        self.extend(items)
+
+    def append(self, item):
+        self._batch.append(item)
+        self.count += 1
+        if len(self._batch) >= SPILL_BATCH_SIZE:
+            self._flush()
+
+    def extend(self, items):
+        for batch in batched(items, SPILL_BATCH_SIZE):
+            self._flush()
+            self.count += len(batch)
+            self._dump(batch)
+
+    def _dump(self, batch):
+        self._fp.seek(0, 2)
+        pickle.dump(pack_items(batch), self._fp, pickle.HIGHEST_PROTOCOL)
+
+    def _flush(self):
+        if self._batch:
+            self._dump(self._batch)
+            self._batch = []
+
+    def __iter__(self):
+        self._flush()
+        self._fp.seek(0)
+        while True:
+            try:
+                packed = pickle.load(self._fp)
+            except EOFError:
+                return
+            for item in unpack_items(packed):
+                yield item
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._fp.close()
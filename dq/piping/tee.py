@@ -7,7 +7,12 @@ from __future__ import absolute_import
 #          with itertools.tee...
 # todo: then figure out how to test it..
 
+import collections
+import itertools
+import sys
+
 from greenlet import greenlet
+import six
 
 
 # ------------------------------------------------------------
@@ -40,3 +45,200 @@ def dispatch_stream(stream, *consumers):
     for item in stream:
         for g in greenlets:
             g.switch(item)
+
+
+# ------------------------------------------------------------
+# Bounded tee, with lockstep scheduling of consumers
+# ------------------------------------------------------------
+
+_BLOCKED, _DONE = 'blocked', 'done'
+
+# Items read from the source at once
+_FETCH_SIZE = 256
+
+
+class TeeOverflowError(Exception):
+    pass
+
+
+class LockstepScheduler(object):
+    """
+    Run functions consuming :py:class:`BoundedTee` streams, each
+    one in its own greenlet.
+
+    When a consumer gets too far ahead of the others, it switches
+    back to the scheduler, which resumes the other ones until they
+    catch up.
+    """
+
+    def __init__(self):
+        self.greenlet = None
+        self.progress = 0  # Count of items delivered by tees
+
+    def wait(self):
+        """Called by consumers that cannot proceed"""
+
+        current = greenlet.getcurrent()
+        if self.greenlet is None or current is self.greenlet:
+            raise TeeOverflowError(
+                "Tee buffer is full, and the other consumers are not "
+                "running: this pipeline would need unbounded buffering")
+        self.greenlet.switch((_BLOCKED, current))
+
+    def run(self, functions):
+        """
+        Run ``functions`` (callables without arguments) concurrently,
+        and return a list of their results.
+        """
+
+        results = [None] * len(functions)
+
+        def _wrap(index, func):
+            def wrapper():
+                results[index] = func()
+                return _DONE, index
+            return wrapper
+
+        runnable = [greenlet(_wrap(index, func))
+                    for index, func in enumerate(functions)]
+        blocked = []
+        checkpoint = self.progress
+        done = 0
+
+        self.greenlet = greenlet.getcurrent()
+        try:
+            while done < len(functions):
+                if not runnable:
+                    if self.progress == checkpoint:
+                        # Nobody can proceed: the slowest consumer
+                        # is not one of the running functions.
+                        raise TeeOverflowError(
+                            "All the consumers are waiting for a stream "
+                            "which is not being consumed: this pipeline "
+                            "would need unbounded buffering")
+                    checkpoint = self.progress
+                    runnable, blocked = blocked, []
+
+                event, value = runnable.pop(0).switch()
+                if event == _BLOCKED:
+                    blocked.append(value)
+                else:
+                    done += 1
+        finally:
+            self.greenlet = None
+
+        return results
+
+
+class BoundedTee(object):
+    """
+    Like ``itertools.tee``, but buffering at most ``maxsize`` items.
+
+    When a consumer would need to read beyond the buffer size, it asks
+    ``scheduler`` to run the others, or raises ``TeeOverflowError``.
+
+    Consumers take all the items available to them at once, and the
+    buffer is only trimmed when the slowest consumers move: the cost
+    per item does not grow with the number of consumers.
+    """
+
+    def __init__(self, iterable, count, maxsize=None, scheduler=None):
+        self.source = iter(iterable)
+        self.maxsize = maxsize
+        self.scheduler = scheduler
+        self.buffer = collections.deque()
+        self.offset = 0  # position of buffer[0] in the stream
+        self.positions = [0] * count
+        self.active = set(xrange(count))
+        self.lagging = count  # active consumers at position ``offset``
+        self.exhausted = False
+        self.error = None
+
+    def consumers(self):
+        return [self._consumer(index) for index in xrange(len(self.positions))]
+
+    def close(self, index):
+        """Detach a consumer, which will not read any more"""
+
+        if index in self.active:
+            self.active.discard(index)
+            self._moved(self.positions[index])
+
+    def _moved(self, position):
+        """Called when an active consumer leaves ``position``"""
+
+        # Only the slowest consumers hold the buffer: the others
+        # can move without trimming anything.
+        if position == self.offset:
+            self.lagging -= 1
+            if not self.lagging:
+                self._trim()
+
+    def _trim(self):
+        positions = self.positions
+        if self.active:
+            lowest = min(positions[i] for i in self.active)
+            self.lagging = sum(1 for i in self.active
+                               if positions[i] == lowest)
+        else:
+            lowest = self.offset + len(self.buffer)
+        if lowest - self.offset >= len(self.buffer):
+            self.buffer.clear()
+        else:
+            for _ in xrange(lowest - self.offset):
+                self.buffer.popleft()
+        self.offset = lowest
+
+    def _wait(self):
+        if self.scheduler is None:
+            raise TeeOverflowError(
+                "Tee buffer exceeded {0} items".format(self.maxsize))
+        self.scheduler.wait()
+
+    def _fetch(self, count):
+        """Read up to ``count`` items from the source, and return them"""
+
+        if self.error is not None:
+            six.reraise(*self.error)
+        if self.exhausted:
+            return []
+        items = []
+        try:
+            items.extend(itertools.islice(self.source, count))
+        except Exception:
+            self.error = sys.exc_info()
+            if not items:
+                raise
+            # Raised by the next read, after the items read before
+        else:
+            self.exhausted = len(items) < count
+        self.buffer.extend(items)
+        return items
+
+    def _consumer(self, index):
+        try:
+            while True:
+                start = self.positions[index] - self.offset
+                if start < len(self.buffer):
+                    # Take all the buffered items at once: the position
+                    # only has to be updated once for all of them.
+                    items = list(itertools.islice(self.buffer, start, None))
+                else:
+                    count = _FETCH_SIZE
+                    if self.maxsize is not None:
+                        count = min(count, self.maxsize - len(self.buffer))
+                        if count <= 0 and not self.exhausted:
+                            self._wait()
+                            continue
+                    items = self._fetch(max(count, 1))
+                    if not items:
+                        return
+                position = self.positions[index]
+                self.positions[index] = position + len(items)
+                self._moved(position)
+                if self.scheduler is not None:
+                    self.scheduler.progress += len(items)
+                for item in items:
+                    yield item
+        finally:
+            self.close(index)
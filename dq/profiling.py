@@ -0,0 +1,160 @@
+"""
+Per-device profiling of pipeline execution ("explain analyze").
+
+When profiling, each device is wrapped to record the items it reads
+and yields, and the wall / CPU time spent inside it: time spent by
+upstream devices producing its input is not counted. Memory is the
+growth of the process peak RSS while running the device.
+
+Statistics are collected in a tree of :py:class:`ProfileNode`,
+matching the nesting of pipelines and blocks.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import resource
+import sys
+import time
+
+from .ast import Device
+from .piping.base import BatchStream
+
+
+def _now():
+    return (time.time(), time.clock(),
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+class ProfileNode(object):
+    """Statistics for a pipeline, block or device"""
+
+    def __init__(self, label):
+        self.label = label
+        self.children = []
+        self.items_in = None
+        self.items_out = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.memory = 0
+
+    def child(self, label):
+        node = ProfileNode(label)
+        self.children.append(node)
+        return node
+
+    def charge(self, start, sign=1):
+        """Add (or remove) resources used since ``start``"""
+
+        wall, cpu, memory = _now()
+        self.wall += sign * (wall - start[0])
+        self.cpu += sign * (cpu - start[1])
+        self.memory += sign * (memory - start[2])
+
+    def totals(self):
+        """Get ``(wall, cpu, memory)``, including children"""
+
+        totals = [self.wall, self.cpu, self.memory]
+        for child in self.children:
+            for index, value in enumerate(child.totals()):
+                totals[index] += value
+        return tuple(totals)
+
+    @property
+    def selectivity(self):
+        if not self.items_in or self.items_out is None:
+            return None
+        return float(self.items_out) / self.items_in
+
+
+class Profile(ProfileNode):
+    """Root of a profile tree, filled by ``execute(profile=...)``"""
+
+    def __init__(self):
+        super(Profile, self).__init__('Profile')
+
+    def report(self, fp=None):
+        """Write the annotated plan tree to ``fp`` (default: stderr)"""
+
+        fp = sys.stderr if fp is None else fp
+        for child in self.children:
+            _report(child, fp, 0)
+
+
+def _report(node, fp, depth):
+    wall, cpu, memory = node.totals()
+    columns = []
+    if node.items_in is not None:
+        columns.append('in={0}'.format(node.items_in))
+    if node.items_out is not None:
+        columns.append('out={0}'.format(node.items_out))
+    if node.selectivity is not None:
+        columns.append('sel={0:.1%}'.format(node.selectivity))
+    columns.append('wall={0:.4f}s cpu={1:.4f}s mem=+{2}KB'
+                   .format(wall, cpu, memory))
+
+    label = '  ' * depth + node.label
+    fp.write('{0:<40} {1}\n'.format(label, ' '.join(columns)))
+    for child in node.children:
+        _report(child, fp, depth + 1)
+
+
+def device_label(device):
+    """Name of a device, including the devices it replaces"""
+
+    inner = [x for x in device.args if isinstance(x, Device)]
+    if not inner:
+        return device.name
+    return '{0}({1})'.format(
+        device.name, ' | '.join(device_label(x) for x in inner))
+
+
+def _iterate(stream, node, batches, sign):
+    # Charge time spent in next() to the node (sign=1, for its
+    # output), or remove it (sign=-1, for its input); count items.
+    attribute = 'items_out' if sign > 0 else 'items_in'
+    if getattr(node, attribute) is None:
+        setattr(node, attribute, 0)
+
+    iterator = iter(stream)
+    while True:
+        start = _now()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            node.charge(start, sign)
+        count = len(item) if batches else 1
+        setattr(node, attribute, getattr(node, attribute) + count)
+        yield item
+
+
+def _wrap(stream, node, sign):
+    if isinstance(stream, BatchStream):
+        return BatchStream(_iterate(stream.batches, node, True, sign))
+    if isinstance(stream, collections.Iterator):
+        return _iterate(stream, node, False, sign)
+    return stream
+
+
+def profile_call(node, function, args):
+    """Call a device, recording statistics in ``node``"""
+
+    args = [_wrap(arg, node, -1) for arg in args]
+    start = _now()
+    try:
+        result = function(*args)
+    finally:
+        node.charge(start)
+    return _wrap(result, node, 1)
+
+
+def materialize(result):
+    """Consume streams in a result, for statistics to be complete"""
+
+    if isinstance(result, tuple):
+        return tuple(materialize(x) for x in result)
+    if isinstance(result, collections.Iterator):
+        return iter(list(result))
+    return result
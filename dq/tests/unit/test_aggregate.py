@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+
+import bisect
+import random
+
+import pytest
+
+from dq.execution import execute
+from dq.parser import parser
+from dq.piping.aggregate import HyperLogLog, TDigest
+
+
+@pytest.mark.parametrize('batch_size', [None, 100])
+def test_aggregates_block(batch_size):
+    values = [{'n': x % 7, 'x': x} for x in xrange(1000)]
+    pipe = parser.parse("""
+    { Count(), Count(item['n'] == 0), Sum(item['n']), Min(item['x']),
+      Max(item['x']), Mean(item['n']), Variance(item['x'], ddof=0),
+      TopK(2, key=item['n'] * 1000 + item['x']) }
+    """)
+    stream = (x for x in values)
+    result = execute(pipe, (stream,), batch_size=batch_size)
+    assert result == (
+        1000, 143, sum(x % 7 for x in xrange(1000)), 0, 999,
+        sum(x % 7 for x in xrange(1000)) / 1000.0,
+        (1000 ** 2 - 1) / 12.0,
+        [{'n': 6, 'x': 993}, {'n': 6, 'x': 986}])
+
+
+def test_aggregates_empty():
+    pipe = parser.parse("""
+    { Count(), Sum(), Min(), Max(), Mean(), Variance(), TopK(3),
+      CountDistinct(), Quantiles(item, [0.5]) }
+    """)
+    assert execute(pipe, ((x for x in []),)) == (
+        0, 0, None, None, None, None, [], 0, [None])
+
+
+def test_variance_stable():
+    # Large offsets lose precision with the naive formula
+    values = [1e9 + x for x in (4, 7, 13, 16)]
+    pipe = parser.parse("Variance()")
+    assert execute(pipe, (iter(values),)) == 30.0
+
+
+@pytest.mark.parametrize('count', [10, 1000, 100000])
+def test_hyperloglog(count):
+    sketch = HyperLogLog()
+    sketch.update(str(x % count) for x in xrange(count * 2))
+    assert abs(sketch.count() - count) <= count * 0.03
+
+
+def test_count_distinct():
+    pipe = parser.parse("CountDistinct(item % 500, precision=12)")
+    assert abs(execute(pipe, (iter(xrange(10000)),)) - 500) < 25
+
+
+def test_tdigest():
+    rnd = random.Random(0)
+    values = [rnd.expovariate(1) for _ in xrange(50000)]
+    digest = TDigest()
+    digest.update(values)
+    assert len(digest.means) <= 100
+
+    # Compare ranks, accuracy is better near the tails
+    values.sort()
+    for q in (0.001, 0.01, 0.1, 0.5, 0.9, 0.99, 0.999):
+        rank = bisect.bisect(values, digest.quantile(q)) / float(len(values))
+        assert abs(rank - q) <= 0.01 * min(q, 1 - q) + 0.0005
+    assert digest.quantile(0) == values[0]
+    assert digest.quantile(1) == values[-1]
+
+
+def test_tdigest_discrete():
+    # Repeated integers (means must not be rounded)
+    digest = TDigest()
+    digest.update(x % 100 for x in xrange(100000))
+    for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+        assert abs(digest.quantile(q) - 100 * q) <= 1
+
+    # Centroids of a single value give values of the data
+    digest = TDigest()
+    digest.update(x % 10 for x in xrange(100000))
+    assert len(digest.means) == 10
+    assert [digest.quantile(q) for q in (0.05, 0.43, 0.95)] == [0, 4, 9]
+
+
+def test_quantiles():
+    pipe = parser.parse("Quantiles(item * 2, [0.25, 0.5])")
+    low, median = execute(pipe, (iter(xrange(1001)),))
+    assert abs(low - 500) <= 1 and abs(median - 1000) <= 1
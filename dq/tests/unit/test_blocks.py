@@ -0,0 +1,199 @@
+from __future__ import absolute_import
+
+import threading
+
+import pytest
+
+from dq.blocks import QueueTee
+from dq.piping.tee import BoundedTee, TeeOverflowError
+from dq.execution import DEVICES_REGISTER, execute
+from dq.parser import parser
+
+
+class CountingInput(object):
+    def __init__(self, count):
+        self.count = count.evaluate()
+
+    def __call__(self):
+        for item in xrange(self.count):
+            yield item
+
+
+class Ignore(object):
+    def __call__(self, stream):
+        return 'ignored'
+
+
+class Fail(object):
+    def __call__(self, stream):
+        for item in stream:
+            if item == 5:
+                raise ValueError("Failed!")
+        return 'done'
+
+
+DEVICES_REGISTER.update({
+    'Counting': CountingInput,
+    'Ignore': Ignore,
+    'Fail': Fail,
+})
+
+
+def test_queue_tee():
+    tee = QueueTee(iter(xrange(100)), 2, maxsize=3)
+    first, second = tee.consumer(0), tee.consumer(1)
+    tee.start()
+
+    assert [(a, b) for a, b in zip(first, second)] == \
+        [(x, x) for x in xrange(100)]
+
+
+def test_queue_tee_closed_consumer():
+    tee = QueueTee(iter(xrange(1000)), 2, maxsize=8)
+    assert tee.message_size == 2
+    first, second = tee.consumer(0), tee.consumer(1)
+    tee.start()
+
+    # The feeder must not stay blocked on the full queue of a
+    # consumer that went away.
+    assert [next(first) for _ in xrange(3)] == [0, 1, 2]
+    first.close()
+    assert list(second) == range(1000)
+
+
+def test_threaded_block():
+    pipe = parser.parse("""
+    Counting(1000) | {
+        Filter(item % 100 == 0) | List(),
+        Map(item * 2) | Filter(item > 1990),
+        Ignore(),
+    }
+    """)
+    result = execute(pipe, block_mode='threads', queue_size=10)
+
+    assert result[0] == range(0, 1000, 100)
+    assert list(result[1]) == [1992, 1994, 1996, 1998]
+    assert result[2] == 'ignored'
+
+
+def test_threaded_block_error():
+    pipe = parser.parse("""
+    Counting(1000) | { List(), Fail() }
+    """)
+    with pytest.raises(ValueError):
+        execute(pipe, block_mode='threads', queue_size=10)
+
+
+def test_invalid_block_mode():
+    pipe = parser.parse("Counting(10) | List()")
+    with pytest.raises(ValueError):
+        execute(pipe, block_mode='nope')
+
+
+def test_lockstep_block():
+    pipe = parser.parse("""
+    Counting(1000) | {
+        Filter(item % 100 == 0) | List(),
+        Map(item * 2) | Filter(item > 1990) | List(),
+        Ignore(),
+        { List(), Filter(item < 2) | List() },
+    }
+    """)
+    result = execute(pipe, block_mode='lockstep', max_buffer=2)
+
+    assert result[0] == range(0, 1000, 100)
+    assert result[1] == [1992, 1994, 1996, 1998]
+    assert result[2] == 'ignored'
+    assert result[3] == (range(1000), [0, 1])
+
+
+def test_lockstep_block_lazy_pipeline():
+    # The second pipeline is only consumed after the block is done
+    code = """
+    Counting({0}) | {{ List(), Filter(item % 2 == 0) }}
+    """
+
+    def run(count, **kwargs):
+        return execute(parser.parse(code.format(count)),
+                       block_mode='lockstep', **kwargs)
+
+    result = run(10, max_buffer=20)
+    assert list(result[1]) == [0, 2, 4, 6, 8]
+
+    with pytest.raises(TeeOverflowError):
+        run(100, max_buffer=20)
+    # Lockstep is the default mode
+    with pytest.raises(TeeOverflowError):
+        execute(parser.parse(code.format(100)), max_buffer=20)
+
+    # Unbounded buffering must be asked for explicitly
+    result = run(100, max_buffer=None)
+    assert len(list(result[1])) == 50
+    result = execute(parser.parse(code.format(100)), block_mode='tee')
+    assert len(list(result[1])) == 50
+
+
+def test_bounded_tee():
+    first, second = BoundedTee(iter(xrange(10)), 2, maxsize=3).consumers()
+
+    assert [next(first) for _ in xrange(3)] == [0, 1, 2]
+    with pytest.raises(TeeOverflowError):
+        next(first)
+
+    # The failed consumer is detached, and doesn't hold the buffer
+    assert list(second) == range(10)
+
+
+def test_bounded_tee_error():
+    def source():
+        for i in xrange(5):
+            yield i
+        raise ValueError('source')
+
+    first, second = BoundedTee(source(), 2).consumers()
+
+    # Items read before the error are delivered to all consumers
+    for consumer in (first, second):
+        assert [next(consumer) for _ in xrange(5)] == range(5)
+        with pytest.raises(ValueError):
+            next(consumer)
+
+
+@pytest.mark.parametrize('batch_size', [None, 4])
+def test_pipelined(batch_size):
+    threads = set()
+
+    class Stage(object):
+        def __init__(self):
+            pass
+
+        def __call__(self, stream):
+            for item in stream:
+                threads.add(threading.current_thread())
+                yield item
+
+    DEVICES_REGISTER['Stage'] = Stage
+    try:
+        pipe = parser.parse("""
+        Stage() | Map(item * 2) | Stage() | { Filter(item > 10), Stage() }
+        """)
+        result = execute(pipe, (iter(range(10)),), pipelined=True,
+                         batch_size=batch_size, queue_size=2, fuse=False)
+    finally:
+        del DEVICES_REGISTER['Stage']
+
+    assert [list(x) for x in result] == [[12, 14, 16, 18], range(0, 20, 2)]
+    assert threading.current_thread() not in threads
+    assert len(threads) >= 2
+
+
+def test_pipelined_error():
+    pipe = parser.parse("Map(1 / (item - 5)) | Map(item) | List()")
+    with pytest.raises(ZeroDivisionError):
+        execute(pipe, (iter(range(10)),), pipelined=True, fuse=False)
+
+
+def test_pipelined_lockstep():
+    with pytest.raises(ValueError):
+        execute(parser.parse("Map(item)"), (iter([]),), pipelined=True,
+                block_mode='lockstep')
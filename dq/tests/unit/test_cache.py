@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+
+import ast
+import os
+
+from dq import cache
+from dq.ast import Pipeline, iter_expressions
+from dq.execution import execute
+
+
+QUERY = """
+Filter(item % 2 == 0) | { Map(item * 10) | List(), List() }
+"""
+
+
+def test_cached_parse(tmpdir, monkeypatch):
+    cache_dir = str(tmpdir.join('cache'))
+    tree = cache.parse(QUERY, cache_dir=cache_dir)
+
+    assert isinstance(tree, Pipeline)
+    assert len(os.listdir(cache_dir)) == 1
+
+    # A cache hit must not need the parser
+    import dq.parser
+    monkeypatch.setattr(dq.parser, 'parser', None)
+    cached = cache.parse(QUERY, cache_dir=cache_dir)
+
+    assert [ast.dump(x.node) for x in iter_expressions(cached)] == \
+        [ast.dump(x.node) for x in iter_expressions(tree)]
+    assert cached[0].args[0]._compiled is not None
+    assert cached[0].args[0]._functions[('item',)](4) is True
+
+    result = execute(cached, (iter(xrange(5)),))
+    assert result == ([0, 20, 40], [0, 2, 4])
+
+
+def test_cached_parse_corrupted(tmpdir):
+    cache_dir = str(tmpdir)
+    path = tmpdir.join(cache.cache_key(QUERY) + '.pickle')
+    path.write('garbage')
+
+    tree = cache.parse(QUERY, cache_dir=cache_dir)
+    assert isinstance(tree, Pipeline)
+    assert path.read() != 'garbage'
+
+
+def test_cache_key():
+    assert cache.cache_key(QUERY) != cache.cache_key(QUERY + ' ')
+    assert cache.cache_key(QUERY) == cache.cache_key(QUERY)
+
+
+def test_cache_prune(tmpdir, monkeypatch):
+    monkeypatch.setattr(cache, 'MAX_ENTRIES', 2)
+    cache_dir = str(tmpdir)
+    queries = ['Map(item)', 'Map(item + 1)', 'Map(item + 2)']
+
+    def path(query):
+        return os.path.join(cache_dir, cache.cache_key(query) + '.pickle')
+
+    cache.parse(queries[0], cache_dir=cache_dir)
+    cache.parse(queries[1], cache_dir=cache_dir)
+    os.utime(path(queries[0]), (1000, 1000))
+    os.utime(path(queries[1]), (2000, 2000))
+
+    # Cache hits count as uses
+    cache.parse(queries[0], cache_dir=cache_dir)
+    cache.parse(queries[2], cache_dir=cache_dir)
+
+    assert sorted(os.listdir(cache_dir)) == sorted(
+        os.path.basename(path(x)) for x in (queries[0], queries[2]))
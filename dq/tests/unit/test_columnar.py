@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+
+import pytest
+
+from dq.execution import execute
+from dq.parser import parser
+
+pytest.importorskip('numpy')
+
+from dq.piping.columnar import Vectorizer, NotVectorizable  # noqa
+
+
+PRICES_CSV = (
+    "id,name,price\r\n"
+    "1,item-1,10.0\r\n"
+    "2,item-2,20.0\r\n"
+    "3,item-3,\r\n"
+    "4,item-4,80.0\r\n"
+    "5,item-5,95.5\r\n"
+)
+
+
+@pytest.fixture
+def prices_file(tmpdir):
+    infile = tmpdir.join('prices.csv')
+    infile.write(PRICES_CSV)
+    return str(infile)
+
+
+def _run_both(code, **kw):
+    pipe = parser.parse(code)
+    expected = list(execute(pipe, **kw))
+    result = list(execute(pipe, columnar=True, **kw))
+    assert result == expected
+    return result
+
+
+def test_columnar_filter(prices_file):
+    result = _run_both("""
+    InCSV({0!r}, header=True)
+    | Filter(item.price != '' and float(item.price) >= 20)
+    | Filter(not item.name == 'item-4')
+    """.format(prices_file))
+
+    assert [tuple(x) for x in result] == [
+        ('2', 'item-2', '20.0'),
+        ('5', 'item-5', '95.5'),
+    ]
+
+
+def test_columnar_map(prices_file):
+    result = _run_both("""
+    InCSV({0!r}, header=True)
+    | Filter(item.price != '')
+    | Map(float(item.price) * 2 + int(item.id))
+    """.format(prices_file), batch_size=2)
+
+    assert result == [21.0, 42.0, 164.0, 196.0]
+
+
+def test_columnar_conversions(tmpdir):
+    # Values are converted by Python, as in row-wise execution
+    infile = tmpdir.join('numbers.csv')
+    infile.write("1, 2.5\r\n123456789012345678901234567890,1e3\r\n")
+    result = _run_both("""
+    InCSV({0!r})
+    | Filter(float(item[1]) > 0)
+    | Map(int(item[0]) + 1)
+    """.format(str(infile)))
+
+    assert result == [2, 123456789012345678901234567891]
+
+
+def test_columnar_fallback(prices_file):
+    # ``len()`` is not vectorized, nor anything after it
+    result = _run_both("""
+    InCSV({0!r}, header=True)
+    | Filter(item.price != '')
+    | Filter(len(item.name) == 6)
+    | Map(item.name)
+    """.format(prices_file))
+
+    assert result == ['item-1', 'item-2', 'item-4', 'item-5']
+
+
+def test_vectorizer_refuses_mixed_kinds():
+    from dq.ast import Expression
+
+    vectorizer = Vectorizer(('id', 'price'))
+    for code in ('item.price > 10', 'item.foo == "x"', 'item + 1',
+                 'float(item.price) and True'):
+        with pytest.raises(NotVectorizable):
+            vectorizer.translate(Expression.from_string(code).node)
@@ -0,0 +1,180 @@
+from __future__ import absolute_import
+
+import bz2
+import cStringIO
+import gzip
+import sys
+import zlib
+
+import pytest
+
+from dq.execution import execute
+from dq.parser import parser
+from dq.piping import compression
+from dq.piping.compression import detect, open_file, readahead
+
+
+LINES = ''.join('{0},name {0}\n'.format(x) for x in xrange(5000))
+
+
+def _gzip(path, data):
+    with gzip.open(path, 'wb') as fp:
+        fp.write(data)
+
+
+def _bz2(path, data):
+    with open(path, 'wb') as fp:
+        fp.write(bz2.compress(data))
+
+
+@pytest.mark.parametrize('extension,write', [
+    ('.gz', _gzip),
+    ('.bz2', _bz2),
+])
+def test_read(tmpdir, monkeypatch, extension, write):
+    # Small chunks, to exercise the queue
+    monkeypatch.setattr(compression, 'CHUNK_SIZE', 1024)
+    path = str(tmpdir.join('data' + extension))
+    write(path, LINES)
+
+    assert detect(path).extensions == (extension,)
+    with open_file(path) as fp:
+        assert list(fp) == LINES.splitlines(True)
+
+
+def test_detect_magic(tmpdir):
+    path = str(tmpdir.join('data'))
+    _gzip(path, LINES)
+    assert detect(path).name == 'gzip'
+    assert detect(path, reading=False) is None
+    with open_file(path) as fp:
+        assert fp.read() == LINES
+
+    plain = tmpdir.join('plain')
+    plain.write(LINES)
+    assert detect(str(plain)) is None
+
+    path = str(tmpdir.join('data'))
+    _bz2(path, LINES)
+    assert detect(path).name == 'bz2'
+    _bz2(path, '')
+    assert detect(path).name == 'bz2'
+    plain.write('BZh,text\nBZh9,more text\n')
+    assert detect(str(plain)) is None
+
+
+def test_concatenated_members(tmpdir):
+    path = str(tmpdir.join('data.gz'))
+    with open(path, 'wb') as fp:
+        for part in ('first\n', 'second\n'):
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            fp.write(compressor.compress(part) + compressor.flush())
+    with open_file(path) as fp:
+        assert fp.read() == 'first\nsecond\n'
+
+
+def test_corrupted(tmpdir):
+    path = tmpdir.join('data.gz')
+    path.write('\x1f\x8b not really gzip', 'wb')
+    with pytest.raises(zlib.error):
+        with open_file(str(path)) as fp:
+            fp.read()
+
+
+def test_write(tmpdir):
+    path = str(tmpdir.join('data.bz2'))
+    with open_file(path, 'wb') as fp:
+        for line in LINES.splitlines(True):
+            fp.write(line)
+    with open(path, 'rb') as fp:
+        assert bz2.decompress(fp.read()) == LINES
+
+
+def test_missing_codec(tmpdir, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'zstandard', None)
+    with pytest.raises(ImportError):
+        open_file(str(tmpdir.join('data.zst')), 'wb')
+
+
+def test_csv_devices(tmpdir):
+    infile = str(tmpdir.join('input.csv.gz'))
+    outfile = str(tmpdir.join('output.csv.gz'))
+    _gzip(infile, LINES)
+
+    code = """
+    InCSV({0!r}, fieldnames=['id', 'name']) | Filter(item.id < '2')
+    | OutCSV({1!r})
+    """.format(infile, outfile)
+    execute(parser.parse(code))
+
+    with gzip.open(outfile) as fp:
+        expected = [x for x in LINES.splitlines() if x < '2']
+        assert fp.read().splitlines() == expected
+
+
+@pytest.mark.parametrize('size', [True, 100])
+def test_readahead(tmpdir, size):
+    path = tmpdir.join('data.csv')
+    path.write(LINES)
+    with open_file(str(path), readahead=size) as fp:
+        assert list(fp) == LINES.splitlines(True)
+
+    source = cStringIO.StringIO(LINES)
+    assert readahead(source, size).read() == LINES
+    assert not source.closed
+
+
+def test_readahead_methods():
+    reader = readahead(cStringIO.StringIO(LINES), 100)
+    assert reader.readline() == '0,name 0\n'
+    assert reader.read(5) == '1,nam'
+    assert reader.read() == LINES[14:]
+    assert reader.read(5) == reader.readline() == ''
+
+    # Only '\n' ends lines, as for files
+    reader = readahead(cStringIO.StringIO('a\rb\nc\r\nd'), 3)
+    assert list(reader) == ['a\rb\n', 'c\r\n', 'd']
+
+    # Iterations go on from each other, as for files
+    reader = readahead(cStringIO.StringIO(LINES), 100)
+    assert next(reader) == '0,name 0\n'
+    assert next(iter(reader)) == '1,name 1\n'
+    assert list(reader) == LINES.splitlines(True)[2:]
+
+
+def test_readahead_devices(tmpdir):
+    jsonfile = tmpdir.join('data.jsonl')
+    jsonfile.write('{"a": 1}\n{"a": 2}\n')
+    csvfile = tmpdir.join('data.csv')
+    csvfile.write(LINES)
+
+    code = """
+    {{ InJSONLines({0!r}, readahead=True) | List(),
+       InCSV({1!r}, fieldnames=['id', 'name'], readahead=1024) | List() }}
+    """.format(str(jsonfile), str(csvfile))
+    json_items, csv_items = execute(parser.parse(code))
+    assert json_items == [{'a': 1}, {'a': 2}]
+    assert len(csv_items) == 5000
+    assert csv_items[-1] == ('4999', 'name 4999')
+
+
+@pytest.mark.parametrize('extension,options', [
+    ('.csv.gz', ''),
+    ('.csv', ', readahead=True'),
+])
+def test_csv_header_projection(tmpdir, monkeypatch, extension, options):
+    # The header is read before the projected columns are split
+    monkeypatch.setattr(compression, 'CHUNK_SIZE', 1024)
+    header = ','.join('c{0}'.format(x) for x in xrange(20)) + '\n'
+    lines = ''.join(','.join([str(x)] * 20) + '\n' for x in xrange(5000))
+    path = str(tmpdir.join('data' + extension))
+    if extension.endswith('.gz'):
+        _gzip(path, header + lines)
+    else:
+        with open(path, 'wb') as fp:
+            fp.write(header + lines)
+
+    code = "InCSV({0!r}, header=True{1}) | Map(item.c1) | List()".format(
+        path, options)
+    assert execute(parser.parse(code)) == [str(x) for x in xrange(5000)]
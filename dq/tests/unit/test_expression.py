@@ -0,0 +1,41 @@
+from __future__ import absolute_import
+
+import ast
+import sys
+
+from dq.ast import Expression, fold_constants
+
+
+def test_expression_function():
+    expr = Expression.from_string('item * 2 + offset')
+    func = expr.function('item', 'offset')
+
+    assert func(10, 1) == 21
+    assert func(2, 0) == 4
+    assert expr.function('item', 'offset') is func
+
+
+def test_expression_globals():
+    expr = Expression.from_string('stdout')
+    assert expr.evaluate() is sys.stdout
+    assert expr.function()() is sys.stdout
+    assert expr.evaluate(glob={'stdout': 'hello'}) == 'hello'
+
+
+def test_fold_constants():
+    node = ast.parse('item.price > 60 * 60 + -1').body[0].value
+    folded = fold_constants(node)
+
+    assert isinstance(folded.comparators[0], ast.Num)
+    assert folded.comparators[0].n == 3599
+
+    # The original node must be left alone
+    assert isinstance(node.comparators[0], ast.BinOp)
+
+
+def test_fold_constants_errors_left_to_runtime():
+    node = ast.parse('1 / 0').body[0].value
+    assert isinstance(fold_constants(node), ast.BinOp)
+
+    node = ast.parse('"x" * 10 ** 6').body[0].value
+    assert isinstance(fold_constants(node), ast.BinOp)
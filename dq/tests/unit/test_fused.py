@@ -0,0 +1,123 @@
+from __future__ import absolute_import
+
+import pytest
+
+from dq.ast import Device
+from dq.execution import execute, fuse_pipeline
+from dq.parser import parser
+from dq.piping.base import Overlay
+
+
+def test_fuse_pipeline():
+    pipe = parser.parse("""
+    Input() | Filter(item > 1) | Map(item * 2) | Filter(item < 10) | Out()
+    """)
+    fused = fuse_pipeline(pipe)
+
+    assert len(fused) == 3
+    assert fused[0].name == 'Input'
+    assert fused[1].name == 'Fused'
+    assert [d.name for d in fused[1].args] == ['Filter', 'Map', 'Filter']
+    assert fused[2].name == 'Out'
+
+
+def test_fuse_pipeline_single_device():
+    pipe = parser.parse("Input() | Filter(item > 1) | Out()")
+    fused = fuse_pipeline(pipe)
+
+    assert [d.name for d in fused] == ['Input', 'Filter', 'Out']
+
+
+def test_fused_execution():
+    pipe = parser.parse("""
+    Map(dict(value=item))
+    | Filter(item['value'] % 2 == 0)
+    | Transform(double=item['value'] * 2, value=item['value'])
+    | Map(item['double'])
+    | Filter(item > 4)
+    """)
+    assert isinstance(fuse_pipeline(pipe)[0], Device)
+
+    result = list(execute(pipe, (iter(range(10)),)))
+    assert result == [8, 12, 16]
+
+    result_nofuse = list(execute(pipe, (iter(range(10)),), fuse=False))
+    assert result_nofuse == result
+
+
+@pytest.mark.parametrize('code,expected', [
+    ("Filter(any([item > 3 for item in item])) | Map(list(item))",
+     [[3, 4]]),
+    ("Map(dict(v=item)) | Transform(m=max([item for item in item['v']]))"
+     " | Map(item['m'])", [2, 4]),
+    ("Map([item for item in item]) | Map(item[0])", [1, 3]),
+])
+def test_fused_list_comprehensions(code, expected):
+    # Python 2 list comprehensions leak their variable
+    pipe = parser.parse(code)
+    assert isinstance(fuse_pipeline(pipe)[0], Device)
+    for fuse in (True, False):
+        result = execute(pipe, (iter([[1, 2], [3, 4]]),), fuse=fuse)
+        assert list(result) == expected
+
+
+def test_fused_locals():
+    pipe = parser.parse("Filter(item) | Map(stream)")
+    with pytest.raises(NameError):
+        list(execute(pipe, (iter([1]),)))
+
+
+def test_fused_transform_copies_items():
+    items = [{'a': 1}, {'a': 2}]
+    pipe = parser.parse("Transform(b=item['a'] + 1) | Map(item)")
+    result = list(execute(pipe, (iter(items),)))
+
+    assert result == [{'a': 1, 'b': 2}, {'a': 2, 'b': 3}]
+    assert items == [{'a': 1}, {'a': 2}]
+
+
+@pytest.mark.parametrize('fuse', [True, False])
+@pytest.mark.parametrize('mode,copied,nested_copied', [
+    ('deep', True, True),
+    ('shallow', True, False),
+    ('overlay', True, False),
+    ('none', False, False),
+])
+def test_transform_copy_modes(fuse, mode, copied, nested_copied):
+    items = [{'a': 1, 'tags': []}]
+    pipe = parser.parse("""
+    Transform(copy={0!r}, b=item['a'] + 1)
+    | Transform(copy={0!r}, c=item['tags'].append(1))
+    | Map(item)
+    """.format(mode))
+    result = list(execute(pipe, (iter(items),), fuse=fuse))
+
+    assert result == [{'a': 1, 'b': 2, 'c': None, 'tags': [1]}]
+    assert ('b' not in items[0]) == copied
+    assert (items[0]['tags'] == []) == nested_copied
+    if mode == 'overlay':
+        assert isinstance(result[0], Overlay)
+        assert result[0].base is items[0]
+
+
+def test_transform_invalid_copy_mode():
+    pipe = parser.parse("Transform(copy='nope', b=1) | Map(item)")
+    with pytest.raises(ValueError):
+        list(execute(pipe, (iter([{}]),)))
+
+
+def test_overlay():
+    base = {'a': 1, 'b': 2}
+    item = Overlay.over(base)
+    item['c'] = 3
+    del item['a']
+
+    assert dict(item) == {'b': 2, 'c': 3}
+    assert len(item) == 2
+    assert 'a' not in item
+    assert base == {'a': 1, 'b': 2}
+
+    again = Overlay.over(item)
+    again['d'] = 4
+    assert again.base is base
+    assert 'd' not in item
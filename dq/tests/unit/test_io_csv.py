@@ -0,0 +1,138 @@
+from __future__ import absolute_import
+
+import pytest
+
+from dq.ast import Expression
+from dq.execution import execute
+from dq.parser import parser
+from dq.piping import io_csv
+from dq.piping.io_csv import infer_types, make_line_converter, split_fields
+
+
+TYPED_CSV = (
+    "id,name,price,qty\r\n"
+    "1,foo,10.5,3\r\n"
+    "2,bar,,4\r\n"
+    "3,baz,7,\r\n"
+)
+
+
+@pytest.fixture
+def typed_csv(tmpdir):
+    infile = str(tmpdir.join('input.csv'))
+    with open(infile, 'w') as f:
+        f.write(TYPED_CSV)
+    return infile
+
+
+def test_infer_types():
+    lines = [['1', 'a', '1.5', ''], ['2', '3', '2', ''], ['', 'b', '1e3']]
+    assert infer_types(lines, 4) == [int, None, float, None]
+
+    # Leading zeros would be lost, 'nan' is not a number here
+    lines = [['007', '0.5', '-0', 'nan', '01.5'],
+             ['10', '00', '3', '1.5', '2']]
+    assert infer_types(lines, 5) == [None, None, int, None, None]
+
+
+def test_split_fields():
+    lines = ['a,b,c,d\r\n', '\r\n', '"x\r\n', 'y",z,"w"\r\n', '1,2\r\n',
+             'e,f,g']
+    assert list(split_fields(iter(lines), 2, {})) == [
+        ['a', 'b'], [], ['x\r\ny', 'z', 'w'], ['1', '2'], ['e', 'f']]
+
+
+class _Lines(object):
+    """File object starting a new iterator, over shared chunks, each time"""
+
+    def __init__(self, data):
+        self._lines = data.splitlines(True)
+
+    def __iter__(self):
+        while self._lines:
+            chunk, self._lines[:2] = self._lines[:2], []
+            for line in chunk:
+                yield line
+
+
+def test_split_fields_after_header():
+    header = ','.join('c{0}'.format(x) for x in xrange(20))
+    lines = [','.join([str(x)] * 20) for x in xrange(10)]
+    device = io_csv.InCSV(Expression.from_string("'unused'"),
+                          header=Expression.from_string('True'),
+                          columns=Expression.from_string("['c1']"))
+    device._name_or_fp = _Lines('\r\n'.join([header] + lines))
+
+    assert list(device()) == [(str(x),) for x in xrange(10)]
+
+
+def test_line_converter():
+    convert = make_line_converter([(0, int), (2, float)])
+    assert convert(['1', 'a', '2.5']) == [1, 'a', 2.5]
+    assert convert(['', 'a', '']) == [None, 'a', None]
+    assert convert(['1', 'a']) == [1, 'a']
+    assert convert(['', 'a']) == [None, 'a']
+
+
+@pytest.mark.parametrize('types', [
+    "{'price': float, 'qty': int, 0: int}",
+    "'infer'",
+])
+def test_typed_csv(typed_csv, types):
+    code = """
+    InCSV({0!r}, header=True, types={1})
+    | Filter(item.price is not None and item.price > 8)
+    | Map((item.id, item.name, item.price, item.qty))
+    | List()
+    """.format(typed_csv, types)
+
+    for columnar in (False, True):
+        result = execute(parser.parse(code), columnar=columnar)
+        assert result == [(1, 'foo', 10.5, 3)]
+
+
+def test_typed_csv_infer_sample(typed_csv, monkeypatch):
+    # Types inferred from the first line apply to the following ones
+    monkeypatch.setattr(io_csv, 'INFER_SAMPLE_SIZE', 1)
+    code = "InCSV({0!r}, header=True, types='infer') | Map(item.price)"
+    result = list(execute(parser.parse(code.format(typed_csv))))
+    assert result == [10.5, None, 7.0]
+    assert isinstance(result[2], float)
+
+
+def test_typed_csv_unknown_column(typed_csv):
+    code = "InCSV({0!r}, types={{'nope': int}}) | List()"
+    with pytest.raises(ValueError):
+        execute(parser.parse(code.format(typed_csv)))
+
+
+@pytest.mark.parametrize('options,expected', [
+    ("", "1,foo,10.5,3\r\n2,bar,,4\r\n"),
+    ("autoheader=True",
+     "id,name,price,qty\r\n1,foo,10.5,3\r\n2,bar,,4\r\n"),
+    ("autoheader=True, fieldnames=['qty', 'id']",
+     "qty,id\r\n3,1\r\n4,2\r\n"),
+    ("fieldnames=['name']", "foo\r\nbar\r\n"),
+])
+def test_out_csv(tmpdir, typed_csv, options, expected):
+    outfile = str(tmpdir.join('output.csv'))
+    code = """
+    InCSV({0!r}, header=True) | Filter(item.id != '3')
+    | OutCSV({1!r}, {2})
+    """.format(typed_csv, outfile, options)
+
+    for batch_size in (None, 1):
+        execute(parser.parse(code), batch_size=batch_size)
+        with open(outfile) as f:
+            assert f.read() == expected
+
+
+def test_out_csv_dicts(tmpdir):
+    outfile = str(tmpdir.join('output.csv'))
+    code = """
+    Map({{'a': item, 'b': item * 2}})
+    | OutCSV({0!r}, autoheader=True, fieldnames=['b', 'a'])
+    """.format(outfile)
+    execute(parser.parse(code), (iter([1, 2]),))
+    with open(outfile) as f:
+        assert f.read() == "b,a\r\n2,1\r\n4,2\r\n"
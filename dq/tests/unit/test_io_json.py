@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+
+import json
+from StringIO import StringIO
+
+import pytest
+
+from dq.execution import execute
+from dq.parser import parser
+from dq.piping import io_json
+from dq.piping.io_json import InJSONArray, OutJSON
+
+
+class _Source(InJSONArray):
+    def __init__(self, fp):
+        self._name_or_fp = fp
+
+
+class _Sink(OutJSON):
+    def __init__(self, fp):
+        self._name_or_fp = fp
+
+
+@pytest.mark.parametrize('data', [
+    [],
+    [1, 2.5, -3e10, None, True, 'foo'],
+    [{'a': [1, {'b': u'\xe8'}]}, [], {}, 1234567890],
+])
+def test_json_array(monkeypatch, data):
+    # Small reads, to exercise values split across reads
+    monkeypatch.setattr(io_json, 'READ_SIZE', 3)
+    text = json.dumps(data, indent=2, ensure_ascii=False)
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    assert list(_Source(StringIO(text))()) == data
+
+
+@pytest.mark.parametrize('split', range(1, 6))
+def test_json_array_split_numbers(split):
+    # The first read ends ``split`` characters into the number
+    padding = ' ' * (io_json.READ_SIZE - 1 - split)
+    text = '[' + padding + '13.25, -0.5e3]'
+    assert list(_Source(StringIO(text))()) == [13.25, -500.0]
+
+
+def test_json_array_split_characters(monkeypatch):
+    # Single-byte reads split UTF-8 characters
+    monkeypatch.setattr(io_json, 'READ_SIZE', 1)
+    data = [u'\xe8\u20ac', 1.5, u'\U0001f600']
+    text = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    assert list(_Source(StringIO(text))()) == data
+
+
+@pytest.mark.parametrize('text', ['', '{}', '[1, 2', '[1 2]', '[1,]'])
+def test_json_array_invalid(text):
+    with pytest.raises(ValueError):
+        list(_Source(StringIO(text))())
+
+
+def test_json_array_is_lazy():
+    fp = StringIO('[1, 2, ' + ' ' * (io_json.READ_SIZE * 4) + '3]')
+    stream = _Source(fp)()
+    assert next(stream) == 1
+    assert fp.tell() == io_json.READ_SIZE
+
+
+def test_out_json_stream():
+    out = StringIO()
+    _Sink(out)(x for x in [1, {'a': 2}])
+    assert json.loads(out.getvalue()) == [1, {'a': 2}]
+
+
+def test_json_lines_pipeline(tmpdir):
+    infile = str(tmpdir.join('input.jsonl'))
+    outfile = str(tmpdir.join('output.jsonl'))
+
+    with open(infile, 'w') as f:
+        f.write('{"a": 1}\n\n{"a": 2}\n{"a": 3}\n')
+
+    code = """
+    InJSONLines({0!r}) | Filter(item['a'] != 2) | OutJSONLines({1!r})
+    """.format(infile, outfile)
+
+    for batch_size in (None, 2):
+        execute(parser.parse(code), batch_size=batch_size)
+        with open(outfile) as f:
+            assert f.read() == '{"a": 1}\n{"a": 3}\n'
+
+
+def test_json_array_pipeline(tmpdir):
+    infile = str(tmpdir.join('input.json'))
+    outfile = str(tmpdir.join('output.json'))
+
+    with open(infile, 'w') as f:
+        json.dump([{'a': x} for x in range(10)], f)
+
+    code = """
+    InJSONArray({0!r}) | Map(item['a']) | Filter(item % 3 == 0)
+    | OutJSON({1!r})
+    """.format(infile, outfile)
+    execute(parser.parse(code))
+
+    with open(outfile) as f:
+        assert json.load(f) == [0, 3, 6, 9]
+
+
+def test_out_json_overlay(tmpdir):
+    outfile = str(tmpdir.join('output.jsonl'))
+    code = """
+    Transform(copy='overlay', b=item['a'] * 2) | OutJSONLines({0!r})
+    """.format(outfile)
+    execute(parser.parse(code), (iter([{'a': 1}]),))
+
+    with open(outfile) as f:
+        assert json.loads(f.read()) == {'a': 1, 'b': 2}
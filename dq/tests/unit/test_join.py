@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+
+import collections
+import random
+
+import pytest
+
+from dq.execution import execute
+from dq.parser import parser
+from dq.piping import join as join_module
+
+
+def _expected(left, right, how):
+    by_key = collections.defaultdict(list)
+    for r in right:
+        by_key[r[0]].append(r)
+    left_keys = set(l[0] for l in left)
+
+    pairs = [(l, r) for l in left for r in by_key.get(l[0], ())]
+    if how in ('left', 'outer'):
+        pairs += [(l, None) for l in left if l[0] not in by_key]
+    if how in ('right', 'outer'):
+        pairs += [(None, r) for r in right if r[0] not in left_keys]
+    return sorted(pairs)
+
+
+def _run(left, right, how, build_size):
+    pipe = parser.parse(
+        "Join(item[0], item[0], how={0!r}, build_size={1}) | List()"
+        .format(how, build_size))
+    return sorted(execute(pipe, (iter(left), iter(right))))
+
+
+@pytest.mark.parametrize('how', ['inner', 'left', 'right', 'outer'])
+@pytest.mark.parametrize('sizes', [(3000, 50), (50, 3000), (3000, 2000)])
+@pytest.mark.parametrize('build_size', [100, 10000])
+def test_join(how, sizes, build_size):
+    rnd = random.Random(sum(sizes))
+    left = [(rnd.randint(0, 1000), 'l', x) for x in xrange(sizes[0])]
+    right = [(rnd.randint(0, 1000), 'r', x) for x in xrange(sizes[1])]
+    assert _run(left, right, how, build_size) == \
+        _expected(left, right, how)
+
+
+def test_join_skewed(monkeypatch):
+    # A single key can't be partitioned
+    monkeypatch.setattr(join_module, 'PARTITIONS', 4)
+    left = [(1, 'l', x) for x in xrange(2000)] + [(2, 'l', 0)]
+    right = [(1, 'r', x) for x in xrange(3)] + [(3, 'r', 0)] * 2000
+    assert _run(left, right, 'outer', 100) == \
+        _expected(left, right, 'outer')
+
+
+def test_join_block(tmpdir):
+    users = tmpdir.join('users.csv')
+    users.write('1,alice\n2,bob\n3,carol\n')
+    orders = tmpdir.join('orders.csv')
+    orders.write('10,1\n11,3\n12,1\n13,4\n')
+
+    code = """
+    {{ InCSV({0!r}, fieldnames=['id', 'name']),
+       InCSV({1!r}, fieldnames=['order', 'user']) }}
+    | Join(left_key=item.id, right_key=item.user, how='left')
+    | Map((item[0].name, item[1].order if item[1] else None))
+    | List()
+    """.format(str(users), str(orders))
+    assert sorted(execute(parser.parse(code))) == [
+        ('alice', '10'), ('alice', '12'), ('bob', None), ('carol', '11')]
+
+
+def test_invalid_join_type():
+    with pytest.raises(ValueError):
+        execute(parser.parse("Join(item, item, how='cross')"),
+                (iter([]), iter([])))
@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+
+import collections
+import itertools
+import os
+
+import pytest
+
+from dq.execution import DEVICES_REGISTER, execute
+from dq.parser import parser
+
+
+class Counter(object):
+    """Endless source, recording the items read and its closing"""
+
+    events = []
+
+    def __init__(self):
+        pass
+
+    def __call__(self):
+        try:
+            for item in itertools.count():
+                self.events.append(item)
+                yield item
+        finally:
+            self.events.append('closed')
+
+
+@pytest.fixture
+def counter():
+    Counter.events = []
+    DEVICES_REGISTER['Counter'] = Counter
+    yield Counter
+    del DEVICES_REGISTER['Counter']
+
+
+@pytest.mark.parametrize('batch_size', [None, 2])
+@pytest.mark.parametrize('fuse', [False, True])
+def test_head(counter, batch_size, fuse):
+    pipe = parser.parse("Counter() | Map(item * 2) | Head(3)")
+    result = execute(pipe, batch_size=batch_size, fuse=fuse)
+    assert list(result) == [0, 2, 4]
+    if batch_size:
+        # Whole batches are read
+        assert counter.events == [0, 1, 2, 3, 'closed']
+    else:
+        assert counter.events == [0, 1, 2, 'closed']
+
+
+def test_head_zero(counter):
+    assert list(execute(parser.parse("Counter() | Head(0)"))) == []
+
+
+def _open_files(path):
+    # Only count this file: other tests might leave threads
+    # closing their own files in the background.
+    count = 0
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            if os.readlink(os.path.join('/proc/self/fd', fd)) == path:
+                count += 1
+        except OSError:
+            pass  # Closed meanwhile
+    return count
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'),
+                    reason="needs /proc")
+@pytest.mark.parametrize('options', ['', ', readahead=True'])
+def test_head_closes_files(tmpdir, options):
+    path = tmpdir.join('input.csv')
+    path.write(''.join('{0},x\n'.format(x) for x in xrange(10000)))
+    code = "InCSV({0!r}{1}) | Head(2)".format(str(path), options)
+    pipe = parser.parse(code)
+
+    result = iter(execute(pipe))
+    assert next(result) == ('0', 'x')
+    if not options:
+        # The readahead thread might have read (and closed) it already
+        assert _open_files(str(path)) == 1
+    assert list(result) == [('1', 'x')]
+    # The result is still referenced, the file must be closed anyway
+    assert _open_files(str(path)) == 0
+
+
+def test_sample():
+    pipe = parser.parse("Sample(10, seed=1)")
+    sample = execute(pipe, (iter(xrange(100000)),))
+    assert len(sample) == len(set(sample)) == 10
+    assert sample == execute(pipe, (iter(xrange(100000)),))
+
+    assert sorted(execute(pipe, (iter(xrange(5)),))) == range(5)
+
+
+def test_sample_uniform():
+    # Each item must be picked with the same probability
+    counts = collections.Counter()
+    for seed in xrange(2000):
+        pipe = parser.parse("Sample(5, seed={0})".format(seed))
+        counts.update(x // 10 for x in execute(pipe, (iter(xrange(100)),)))
+    assert len(counts) == 10
+    for count in counts.values():
+        assert 800 < count < 1200
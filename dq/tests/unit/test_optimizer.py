@@ -0,0 +1,155 @@
+from __future__ import absolute_import
+
+import ast
+
+import pytest
+
+from dq.execution import execute, optimize_pipeline
+from dq.optimizer import item_keys
+from dq.parser import parser
+
+
+def _names(pipe):
+    return [device.name for device in pipe]
+
+
+def _source(device):
+    expr, = device.args
+    return ast.dump(expr.node)
+
+
+def _node(text):
+    return ast.dump(ast.parse(text).body[0].value)
+
+
+def test_item_keys():
+    assert item_keys(ast.parse("item['a'] > item['b']")) == set(['a', 'b'])
+    assert item_keys(ast.parse("item['a'] > 1 and 'b' in item")) is None
+    assert item_keys(ast.parse("item.a > 1")) is None
+
+
+def test_drop_noops():
+    pipe = optimize_pipeline(parser.parse("""
+    Map(item * 2) | Map(item) | Filter(True) | Filter(2 - 1) | List()
+    """))
+    assert _names(pipe) == ['Map', 'List']
+
+    # The input might not be a stream
+    pipe = optimize_pipeline(parser.parse("Map(item)"))
+    assert _names(pipe) == ['Map']
+
+    # Transform() copies items
+    pipe = optimize_pipeline(parser.parse("Map(item) | Transform()"))
+    assert _names(pipe) == ['Map', 'Transform']
+
+    pipe = optimize_pipeline(parser.parse("Filter(0) | List()"))
+    assert _names(pipe) == ['Filter', 'List']
+
+
+def test_keep_noops_after_non_streams(tmpdir):
+    infile = tmpdir.join('input.json')
+    infile.write('{"a": 1, "b": 2}')
+    code = "InJSON({0!r}) | Map(item) | List()".format(str(infile))
+
+    pipe = optimize_pipeline(parser.parse(code))
+    assert _names(pipe) == ['InJSON', 'Map', 'List']
+    assert sorted(execute(parser.parse(code))) == ['a', 'b']
+
+
+def test_push_filter_before_transform():
+    pipe = optimize_pipeline(parser.parse("""
+    Transform(b=item['a'] * 2) | Filter(item['a'] > 1)
+    | Transform(c=1) | Filter(item['b'] > 4) | List()
+    """))
+    assert _names(pipe) == ['Filter', 'Transform', 'Filter',
+                            'Transform', 'List']
+    assert _source(pipe[0]) == _node("item['a'] > 1")
+    assert _source(pipe[2]) == _node("item['b'] > 4")
+
+
+def test_push_filter_before_map():
+    pipe = optimize_pipeline(parser.parse("""
+    Map({'x': item.price, 'y': item.name.upper()})
+    | Filter(item['x'] > 10) | Filter(item['y'] == 'A') | List()
+    """))
+    assert _names(pipe) == ['Filter', 'Map', 'Filter', 'List']
+    assert _source(pipe[0]) == _node("item.price > 10")
+
+
+def test_merge_filters():
+    pipe = optimize_pipeline(parser.parse("""
+    Filter(item > 1) | Filter(item < 10 and item != 5)
+    | Filter(item % 2, workers=2) | List()
+    """))
+    assert _names(pipe) == ['Filter', 'Filter', 'List']
+    assert _source(pipe[0]) == _node("item > 1 and item < 10 and item != 5")
+
+
+@pytest.mark.parametrize('code', [
+    "Transform(b=item['a'] * 2) | Filter(item['a'] % 3 == 0) "
+    "| Filter(item['b'] > 2) | Map(item['b'])",
+    "Map(dict(a=item['a'], b=item['a'] * 2)) | Filter(item['a'] > 2) "
+    "| Filter(item['b'] < 16) | Map(item['b'])",
+])
+def test_optimized_execution(code):
+    pipe = parser.parse(code)
+    items = [{'a': x} for x in xrange(10)]
+
+    result = list(execute(pipe, (iter(items),)))
+    assert result == list(execute(pipe, (iter(items),), optimize=False))
+    assert result
+
+
+def _columns(pipe):
+    columns = pipe[0].keywords.get('columns')
+    return columns.evaluate() if columns is not None else None
+
+
+def test_project_columns():
+    pipe = optimize_pipeline(parser.parse("""
+    InCSV('x.csv', header=True) | Filter(float(item.price) > 10)
+    | Map((item.id, item.price)) | OutCSV(stdout)
+    """))
+    assert _columns(pipe) == ['id', 'price']
+
+    for code in [
+            "InCSV('x.csv') | Map(item.id)",
+            "InCSV('x.csv', header=True) | Filter(item.id) | List()",
+            "InCSV('x.csv', header=True) | Map(item)",
+            "InCSV('x.csv', header=True) | Map(item._asdict())",
+            "InCSV('x.csv', header=True) | Transform(a=1) | Map(item.id)",
+    ]:
+        assert _columns(optimize_pipeline(parser.parse(code))) is None
+
+
+def test_project_columns_execution(tmpdir):
+    infile = str(tmpdir.join('input.csv'))
+    with open(infile, 'w') as f:
+        f.write("id,name,price,qty\r\n1,a,10,3\r\n2,b,20,4\r\n")
+
+    code = "InCSV({0!r}, header=True, columns=['qty', 'id']) | List()"
+    rows = execute(parser.parse(code.format(infile)))
+    assert rows == [('3', '1'), ('4', '2')]
+    assert rows[0]._fields == ('qty', 'id')
+
+    code = """
+    InCSV({0!r}, header=True, types={{'qty': int, 'price': float}})
+    | Filter(item.price > 10) | Map(item.qty * 2)
+    """.format(infile)
+    for columnar in (False, True):
+        assert list(execute(parser.parse(code), columnar=columnar)) == [8]
+
+
+@pytest.mark.parametrize('width', [3, 20])
+def test_project_columns_wide(tmpdir, width):
+    # Lines are split with str.split() if enough columns are skipped
+    infile = str(tmpdir.join('input.csv'))
+    header = ['c{0}'.format(x) for x in xrange(width)]
+    with open(infile, 'w') as f:
+        f.write(','.join(header) + '\r\n')
+        f.write(','.join(str(x) for x in xrange(width)) + '\r\n')
+        f.write('"a,b",' + ','.join('x' * (width - 1)) + '\r\n')
+
+    code = "InCSV({0!r}, header=True, columns=['c1', 'c0']) | List()"
+    rows = execute(parser.parse(code.format(infile)))
+    assert rows == [('1', '0'), ('x', 'a,b')]
@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+
+import collections
+import csv
+import pickle
+
+import pytest
+
+from dq.ast import Expression
+from dq.execution import execute
+from dq.parser import parser
+from dq.piping import io_csv
+from dq.piping.io_csv import split_records
+from dq.piping.parallel import parallel_apply
+
+
+def test_expression_pickle():
+    expr = Expression.from_string('item * 2')
+    assert expr.function('item')(2) == 4
+
+    loaded = pickle.loads(pickle.dumps(expr, 2))
+    assert loaded.function('item')(3) == 6
+
+
+def test_parallel_apply():
+    expr = Expression.from_string('item % 3 == 0')
+    result = parallel_apply('filter', expr, iter(xrange(100)), workers=2,
+                            chunk_size=7)
+    assert list(result) == range(0, 100, 3)
+
+    expr = Expression.from_string('item * 2')
+    result = parallel_apply('map', expr, iter(xrange(100)), workers=2,
+                            ordered=False, chunk_size=7)
+    assert sorted(result) == range(0, 200, 2)
+
+
+def test_parallel_apply_namedtuples():
+    row = collections.namedtuple('row', 'id,price')
+    items = [row(x, x * 10.0) for x in xrange(10)]
+
+    expr = Expression.from_string('item.price >= 50')
+    result = parallel_apply('filter', expr, iter(items), workers=2,
+                            chunk_size=3)
+    assert list(result) == items[5:]
+
+
+def test_parallel_apply_error():
+    expr = Expression.from_string('1 / item')
+    result = parallel_apply('map', expr, iter(xrange(10)), workers=2)
+    with pytest.raises(ZeroDivisionError):
+        list(result)
+
+
+def test_parallel_devices():
+    pipe = parser.parse("""
+    Filter(item % 2 == 0, workers=2)
+    | Map(item * 3, workers=2, ordered=True)
+    | List()
+    """)
+    assert execute(pipe, (iter(xrange(10)),)) == [0, 6, 12, 18, 24]
+
+
+def test_split_records():
+    data = 'a,b\n"x\ny",1\n"""q""\n",2\nlast,3'
+    ranges = list(split_records(data, 1))
+    assert [data[start:end] for start, end in ranges] == [
+        'a,b\n', '"x\ny",1\n', '"""q""\n",2\n', 'last,3']
+
+    ranges = list(split_records(data, 1, quotechar=None))
+    assert len(ranges) == 6
+
+    ranges = list(split_records(data, 1000))
+    assert ranges == [(0, len(data))]
+
+
+@pytest.mark.parametrize('header', [False, True])
+def test_parallel_csv(tmpdir, monkeypatch, header):
+    monkeypatch.setattr(io_csv, 'PARALLEL_CHUNK_SIZE', 64)
+
+    lines = [['id', 'text']] + [[str(x), 'line\n"{0}",'.format(x)]
+                                for x in xrange(100)]
+    infile = str(tmpdir.join('input.csv'))
+    with open(infile, 'wb') as f:
+        csv.writer(f).writerows(lines)
+
+    code = """
+    InCSV({0!r}, header={1!r}, workers=2) | Map(tuple(item)) | List()
+    """.format(infile, header)
+    result = execute(parser.parse(code))
+    expected = [tuple(x) for x in lines[1 if header else 0:]]
+    assert result == expected
+
+
+def test_parallel_map_rows(tmpdir):
+    # Namedtuple results must be sent back from workers
+    path = tmpdir.join('input.csv')
+    lines = ['a,aa'] + ['{0},{1}'.format(x, x * 2) for x in xrange(50)]
+    path.write('\n'.join(lines))
+    pipe = parser.parse("InCSV({0!r}, header=True) | Map(item, workers=2)"
+                        " | List()".format(str(path)))
+    result = execute(pipe, optimize=False)
+    assert len(result) == 50
+    assert result[-1] == ('49', '98')
+    assert result[-1]._fields == ('a', 'aa')
+
+
+def test_parallel_unpicklable_results():
+    expr = Expression.from_string('lambda: item')
+    result = parallel_apply('map', expr, iter(xrange(10)), workers=2)
+    with pytest.raises(Exception):
+        list(result)
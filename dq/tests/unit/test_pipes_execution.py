@@ -107,3 +107,45 @@ def test_csv_to_json(tmpdir):
         {'id': 2, 'name': 'item-2', 'price': 20.0},
         {'id': 3, 'name': 'item-3', 'price': 30.0},
     ]
+
+
+def test_filter_csv_batches(tmpdir):
+    infile = str(tmpdir.join('input.csv'))
+    outfile1 = str(tmpdir.join('output1.csv'))
+    outfile2 = str(tmpdir.join('output2.csv'))
+
+    with open(infile, 'w') as f:
+        f.write(SIMPLE_CSV)
+
+    code = """
+    InCSV({0!r}, fieldnames=['id', 'name', 'price']) | {{
+        Filter(float(item.price) >= 90) | OutCSV({1!r}) ,
+        Filter(float(item.price) < 20) | Map(item) | OutCSV({2!r})
+    }}
+    """.format(infile, outfile1, outfile2)
+
+    pipe = parser.parse(code)
+    execute(pipe, batch_size=3)
+
+    assert open(outfile1).read() == EXP_CSV_OUT1
+    assert open(outfile2).read() == EXP_CSV_OUT2
+
+
+def test_batches_to_legacy_devices(tmpdir):
+    infile = str(tmpdir.join('input.csv'))
+
+    with open(infile, 'w') as f:
+        f.write(SIMPLE_CSV)
+
+    code = """
+    InCSV({0!r}) | Map(int(item[0])) | Filter(item % 3 == 0)
+    """.format(infile)
+    pipe = parser.parse(code)
+
+    # List() does not support batches
+    result = execute(parser.parse(code + '| List()'), batch_size=4)
+    assert result == [3, 6, 9]
+
+    # Batches are unwrapped in the returned value
+    result = execute(pipe, batch_size=4)
+    assert list(result) == [3, 6, 9]
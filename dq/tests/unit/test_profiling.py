@@ -0,0 +1,81 @@
+from __future__ import absolute_import
+
+import pytest
+
+from dq.cli import main
+from dq.execution import execute
+from dq.parser import parser
+from dq.profiling import Profile
+
+
+def _tree(node):
+    return (node.label, node.items_in, node.items_out,
+            [_tree(x) for x in node.children])
+
+
+@pytest.mark.parametrize('batch_size', [None, 3])
+def test_profile(batch_size):
+    pipe = parser.parse("""
+    Filter(item % 2 == 0) | { Map(item * 2) | List(), Filter(item > 4) }
+    """)
+    profile = Profile()
+    result = execute(pipe, (iter(range(10)),), fuse=False,
+                     batch_size=batch_size, profile=profile)
+    assert list(result[1]) == [6, 8]
+
+    pipeline, = profile.children
+    assert _tree(pipeline) == ('Pipeline', None, None, [
+        ('Filter', 10, 5, []),
+        ('Block', None, None, [
+            ('Pipeline', None, None, [
+                ('Map', 5, 5, []),
+                ('List', 5, None, [])]),
+            ('Pipeline', None, None, [
+                ('Filter', 5, 2, [])])])])
+
+    assert pipeline.children[0].selectivity == 0.5
+    wall, cpu, memory = pipeline.totals()
+    assert wall >= pipeline.children[0].wall >= 0
+
+
+def test_profile_report(capsys):
+    pipe = parser.parse("Filter(item > 1) | Map(item)")
+    result = execute(pipe, (iter(range(4)),), profile=True)
+
+    # Streams are consumed, for the report to be complete
+    assert list(result) == [2, 3]
+    _, err = capsys.readouterr()
+    assert 'Filter' in err
+    assert 'in=4 out=2 sel=50.0%' in err
+
+
+def test_cli(tmpdir, capsys, monkeypatch):
+    monkeypatch.setenv('DQ_CACHE_DIR', str(tmpdir.join('cache')))
+    infile = str(tmpdir.join('input.csv'))
+    with open(infile, 'w') as f:
+        f.write("1,a\r\n2,b\r\n3,c\r\n")
+
+    main(['--profile', '--no-fuse',
+          "InCSV({0!r}) | Filter(item[0] > '1') | Map(item[1])"
+          .format(infile)])
+
+    out, err = capsys.readouterr()
+    assert out == 'b\nc\n'
+    assert 'InCSV' in err
+    assert 'in=3 out=2' in err
+
+
+@pytest.mark.parametrize('options', [[], ['--batch-size', '2']])
+def test_cli_block(tmpdir, capsys, monkeypatch, options):
+    monkeypatch.setenv('DQ_CACHE_DIR', str(tmpdir.join('cache')))
+    infile = str(tmpdir.join('input.csv'))
+    with open(infile, 'w') as f:
+        f.write("1,a\r\n2,b\r\n3,c\r\n")
+
+    main(options + [
+        "InCSV({0!r}) | {{ Count(), Map(item[1]),"
+        " {{ List(), Map(item[0]) }} }}".format(infile)])
+
+    out, _ = capsys.readouterr()
+    assert out == ("3\na\nb\nc\n"
+                   "[('1', 'a'), ('2', 'b'), ('3', 'c')]\n1\n2\n3\n")
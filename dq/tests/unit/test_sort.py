@@ -0,0 +1,81 @@
+from __future__ import absolute_import
+
+import collections
+import operator
+import random
+
+import pytest
+
+from dq.execution import execute
+from dq.parser import parser
+from dq.piping.sort import external_sort
+from dq.piping.spill import SpillFile
+
+
+def _items(count=1000):
+    rnd = random.Random(42)
+    return [{'id': x, 'group': rnd.randint(0, 20)} for x in xrange(count)]
+
+
+@pytest.mark.parametrize('run_size', [1, 7, 1000, 5000])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_external_sort(run_size, reverse):
+    items = _items()
+    key = operator.itemgetter('group')
+    result = list(external_sort(iter(items), key, reverse, run_size))
+    # Sorting must be stable, as sorted()
+    assert result == sorted(items, key=key, reverse=reverse)
+
+
+def test_external_sort_items():
+    assert list(external_sort(iter([3, 1, 2]), run_size=2)) == [1, 2, 3]
+    assert list(external_sort(iter([]), run_size=2)) == []
+
+
+def test_spill_file():
+    row = collections.namedtuple('row', 'a b')
+    spilled = SpillFile(row(x, str(x)) for x in xrange(3000))
+    assert len(spilled) == 3000
+    assert list(spilled)[-1] == (2999, '2999')
+    assert list(spilled)[-1]._fields == ('a', 'b')
+
+    spilled.append(row(-1, 'x'))
+    assert len(list(spilled)) == 3001
+    spilled.close()
+
+
+@pytest.mark.parametrize('batch_size', [None, 10])
+def test_sort_device(batch_size):
+    items = _items()
+    pipe = parser.parse("Sort(item['group'], reverse=True, run_size=100)"
+                        " | List()")
+    result = execute(pipe, (iter(items),), batch_size=batch_size)
+    assert result == sorted(items, key=lambda x: x['group'], reverse=True)
+
+
+@pytest.mark.parametrize('code', [
+    "Sort(run_size=0)",
+    "GroupBy(item['group'], run_size=-1)",
+])
+def test_invalid_run_size(code):
+    with pytest.raises(ValueError) as excinfo:
+        execute(parser.parse(code + " | List()"), (iter(_items()),))
+    assert 'run_size' in str(excinfo.value)
+
+
+def test_group_by(tmpdir):
+    infile = tmpdir.join('input.csv')
+    infile.write(''.join('{0},{1}\n'.format(x, x % 3) for x in xrange(100)))
+
+    code = """
+    InCSV({0!r}, fieldnames=['id', 'group'], types={{'id': int}}) | {{
+        GroupBy(item.group, run_size=10) | Map((item[0], len(item[1])))
+        | List(),
+        GroupBy(item.group, agg=sum(x.id for x in items)) | Dict()
+    }}
+    """.format(str(infile))
+    counts, sums = execute(parser.parse(code))
+    assert counts == [('0', 34), ('1', 33), ('2', 33)]
+    assert sums == {'0': sum(xrange(0, 100, 3)),
+                    '1': sum(xrange(1, 100, 3)),
+                    '2': sum(xrange(2, 100, 3))}
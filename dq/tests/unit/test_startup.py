@@ -0,0 +1,61 @@
+"""
+Tests for startup costs: parser tables must be loaded from the
+prebuilt modules, and devices only imported when used.
+"""
+
+from __future__ import absolute_import
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import ply.yacc as yacc
+
+import dq
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(dq.__file__)))
+
+
+def _run(code):
+    output = subprocess.check_output(
+        [sys.executable, '-c', textwrap.dedent(code)],
+        cwd=PACKAGE_DIR, stderr=subprocess.STDOUT)
+    return output.strip().splitlines()
+
+
+def test_parser_tables_up_to_date():
+    import dq.parser
+    import dq.parsetab
+
+    pinfo = yacc.ParserReflect(vars(dq.parser))
+    pinfo.get_all()
+    assert pinfo.signature() == dq.parsetab._lr_signature
+
+
+def test_lazy_devices_import():
+    output = _run("""
+    import sys
+    from dq.parser import parser
+    from dq.execution import execute
+    print(execute(parser.parse('Map(item + 1) | List()'), (iter([1]),)))
+    for name in ('dq.piping.io_csv', 'dq.piping.io_json',
+                 'multiprocessing', 'numpy'):
+        print(name in sys.modules)
+    """)
+    assert output == ['[2]', 'False', 'False', 'False', 'False']
+
+
+def test_startup_budget():
+    # Generous budget, to catch gross regressions (eg. tables
+    # being regenerated at each import).
+    output = _run("""
+    import time
+    start = time.time()
+    from dq.parser import parser
+    from dq.execution import execute
+    execute(parser.parse('Map(item) | List()'), (iter([1]),))
+    print(time.time() - start)
+    """)
+    assert float(output[-1]) < 0.5
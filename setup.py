@@ -1,14 +1,21 @@
 import os
+import re
 import sys
 from setuptools import setup, find_packages
 from setuptools.command.test import test as TestCommand
 
-version = '0.1a'
+# The version is defined in dq/__init__.py (used eg. by dq.cache)
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'dq', '__init__.py')) as f:
+    version = re.search(r"^__version__ = '(.*)'$", f.read(), re.M).group(1)
 install_requires = [
     'ply',
     'six',
     'greenlet',
 ]
+extras_require = {
+    'columnar': ['numpy'],
+}
 tests_require = [
     'pytest',
     'pytest-pep8',
@@ -84,6 +91,10 @@ setup(
     description='',
     long_description='',
     install_requires=install_requires,
+    extras_require=extras_require,
+    entry_points={
+        'console_scripts': ['dq = dq.cli:main'],
+    },
     test_suite='dq.tests',
     tests_require=tests_require,
     classifiers=[